@@ -0,0 +1,104 @@
+import time
+import asyncio
+import functools
+import itertools
+import threading
+import contextvars
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from metrics import metrics
+
+# Lower runs first
+READ_PRIORITY = 0
+WRITE_PRIORITY = 1
+
+
+class AdmissionController:
+    """
+    Bounded priority queue in front of a fixed pool of worker threads.
+
+    Read-only requests jump ahead of writes. When the queue is full, `submit`
+    raises asyncio.QueueFull so the caller can answer 429 instead of stalling.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.queue: asyncio.PriorityQueue = asyncio.PriorityQueue(maxsize=max_queue)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chat")
+        self.sequence = itertools.count()
+        self.tasks = []
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.executor.shutdown(wait=False)
+
+    def submit(self, func: Callable, read_only: bool) -> asyncio.Future:
+        """
+        Queue a blocking function to run on a worker thread, in the caller's context.
+
+        Args:
+            func (Callable): The function to run.
+            read_only (bool): Whether the request only reads, which gives it priority.
+
+        Returns:
+            asyncio.Future: Resolves to the function's result.
+
+        Raises:
+            asyncio.QueueFull: If the queue is at capacity.
+        """
+        future = asyncio.get_running_loop().create_future()
+        priority = READ_PRIORITY if read_only else WRITE_PRIORITY
+        try:
+            # The sequence number keeps FIFO order within a priority
+            self.queue.put_nowait((priority, next(self.sequence), time.perf_counter(),
+                                   contextvars.copy_context(), func, future))
+        except asyncio.QueueFull:
+            metrics.inc("queue_rejected_total")
+            raise
+        metrics.set("queue_depth", self.queue.qsize())
+        return future
+
+    async def worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            priority, _, enqueued, context, func, future = await self.queue.get()
+            metrics.set("queue_depth", self.queue.qsize())
+            metrics.observe("queue_wait_seconds", time.perf_counter() - enqueued,
+                            {"priority": "read" if priority == READ_PRIORITY else "write"})
+
+            try:
+                result = await loop.run_in_executor(self.executor, context.run, func)
+                if not future.done():
+                    future.set_result(result)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self.queue.task_done()
+
+
+# One lock per signing wallet; reentrant so a write tool may call another
+wallet_locks = defaultdict(threading.RLock)
+
+
+def serialize_per_wallet(func: Callable, address: str) -> Callable:
+    """
+    Wrap a write tool so only one write per wallet runs at a time, keeping nonces
+    and approvals from interleaving. Read-only tools are left unwrapped and run in parallel.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        with wallet_locks[address]:
+            metrics.observe("wallet_lock_wait_seconds", time.perf_counter() - start,
+                            {"tool": func.__name__})
+            return func(*args, **kwargs)
+
+    return wrapper
@@ -5,20 +5,29 @@ from swarm import Agent
 from web3 import Web3
 from eth_account import Account
 from eth_account.signers.local import LocalAccount
+from price_oracle import PriceOracle
+from simulation import NodeLockMiddleware, simulate_transaction, simulate_plan
+from metrics import RPCMetricsMiddleware, instrument_tools
+from admission import serialize_per_wallet
+from state_store import TransactionJournalMiddleware, check_pending_transactions
 
 provider_url: str = 'http://127.0.0.1:8545'
 # provider_url: str = 'https://rpc.ankr.com/base_sepolia/3ec8a99c8d8a9f1d4b41cbbd6849bd882e7af57f597634fd1f39c6cb5986656f'
 # provider_url: str = 'https://rpc.ankr.com/bsc_testnet_chapel/3ec8a99c8d8a9f1d4b41cbbd6849bd882e7af57f597634fd1f39c6cb5986656f'
 
 w3 = Web3(Web3.HTTPProvider(provider_url))
+w3.middleware_onion.add(RPCMetricsMiddleware, 'metrics')
+w3.middleware_onion.add(TransactionJournalMiddleware, 'journal')
+# Outermost, so time spent waiting for a simulation to finish isn't counted as RPC latency
+w3.middleware_onion.add(NodeLockMiddleware, 'node_lock')
 
 with open('tokens.json') as f:
     tokens = json.load(f)['tokens']
 
 
 def load_wallet() -> LocalAccount:
-    # Load .env file
-    if not load_dotenv():
+    # Load .env file, unless the key is already in the environment (e.g. benchmarks)
+    if not load_dotenv() and "PRIVATE_KEY" not in os.environ:
         raise FileNotFoundError("The .env file is missing.")
 
     # Retrieve the PRIVATE_KEY
@@ -45,6 +54,22 @@ def load_abi(file_path: str):
         return json.load(file)
 
 
+def preflight(tx: dict) -> int:
+    """
+    Simulate a transaction before broadcasting it, so a bad call fails fast instead of burning gas.
+
+    Args:
+        tx (dict): The transaction about to be sent.
+
+    Returns:
+        int: The estimated gas for the transaction.
+    """
+    result = simulate_transaction(w3, tx)
+    if not result["success"]:
+        raise ValueError(f"Transaction would revert: {result['revert_reason']}")
+    return result["gas"]
+
+
 def send_eth(
     sender_account,
     recipient_address,
@@ -170,6 +195,63 @@ def wrap_eth(amount: int):
     return receipt
 
 
+# TWAP window for swap minimums. A spot price can be moved within the block by a sandwich
+SWAP_TWAP_SECONDS = 300
+
+
+def build_swap_plan(token_in: str, token_out: str, amount_in: int, recipient: str,
+                    slippage_tolerance: float) -> list[dict]:
+    """
+    Build the transactions for a swap: an approval if the allowance is too low, then the swap.
+    The swap's minimum output is the TWAP value of `amount_in` less `slippage_tolerance`.
+    """
+    # todo: chain_id
+    router_address = Web3.to_checksum_address(get_crypto_context(
+        '1')['addresses']['uniswap']['universal_router'])
+
+    router_abi = load_abi('./abi/uniswap_swap_router.json')
+    router_contract = w3.eth.contract(address=router_address, abi=router_abi)
+
+    erc20_abi = load_abi('./abi/erc20.json')
+    erc20_contract = w3.eth.contract(
+        address=Web3.to_checksum_address(token_in), abi=erc20_abi)
+
+    allowance = erc20_contract.functions.allowance(
+        wallet.address, router_address).call()
+    print(f"Allowance: {allowance}")
+
+    plan = []
+
+    # max_allowance = 2**256 - 1
+    if allowance < amount_in:
+        # Approve the router to spend the input token
+        plan.append({
+            "from": wallet.address,
+            "to": erc20_contract.address,
+            "data": erc20_contract.encode_abi("approve", args=[router_address, amount_in])
+        })
+
+    fee = 3000
+    path = Web3.to_bytes(hexstr=Web3.to_checksum_address(token_in)) + fee.to_bytes(
+        3, 'big') + Web3.to_bytes(hexstr=Web3.to_checksum_address(token_out))
+
+    # inputs = [encode(['address', 'uint256', 'uint256', 'bytes', 'bool'], [Web3.to_checksum_address(recipient), amount_in, 0, path, True])]
+
+    # 0 (no minimum) if either token has no oracle price
+    amount_out_minimum = get_price_oracle('1').min_amount_out(
+        token_in, token_out, amount_in, slippage_tolerance, twap_seconds=SWAP_TWAP_SECONDS)
+    print(f"Minimum output: {amount_out_minimum}")
+
+    plan.append({
+        "from": wallet.address,
+        "to": router_address,
+        "data": router_contract.encode_abi("exactInputSingle", args=[[Web3.to_checksum_address(token_in), Web3.to_checksum_address(
+            token_out), fee, recipient, amount_in, amount_out_minimum, 0]])
+    })
+
+    return plan
+
+
 def swap_tokens(
     token_in: str | None,
     token_out: str | None,
@@ -195,44 +277,42 @@ def swap_tokens(
 
     print(f"Swapping {amount_in} {token_in} for {token_out}...")
 
-    # todo: chain_id
-    router_address = Web3.to_checksum_address(get_crypto_context(
-        '1')['addresses']['uniswap']['universal_router'])
+    *approvals, swap = build_swap_plan(
+        token_in, token_out, amount_in, recipient, slippage_tolerance)
 
-    router_abi = load_abi('./abi/uniswap_swap_router.json')
-    router_contract = w3.eth.contract(address=router_address, abi=router_abi)
-
-    erc20_abi = load_abi('./abi/erc20.json')
-    erc20_contract = w3.eth.contract(
-        address=Web3.to_checksum_address(token_in), abi=erc20_abi)
-
-    allowance = erc20_contract.functions.allowance(
-        wallet.address, router_address).call()
-    print(f"Allowance: {allowance}")
-
-    # max_allowance = 2**256 - 1
-    if allowance < amount_in:
-        # Approve the router to spend the input token
+    for approval in approvals:
         print('Approving token...')
-        tx_hash = erc20_contract.functions.approve(
-            router_address, amount_in).transact({"from": wallet.address})
+        tx_hash = w3.eth.send_transaction({**approval, "gas": preflight(approval)})
         receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
         print(f"Approved")
 
-    fee = 3000
-    path = Web3.to_bytes(hexstr=Web3.to_checksum_address(token_in)) + fee.to_bytes(
-        3, 'big') + Web3.to_bytes(hexstr=Web3.to_checksum_address(token_out))
-
-    # inputs = [encode(['address', 'uint256', 'uint256', 'bytes', 'bool'], [Web3.to_checksum_address(recipient), amount_in, 0, path, True])] # TODO: Minimum output amount
-
-    tx_hash = router_contract.functions.exactInputSingle([Web3.to_checksum_address(token_in), Web3.to_checksum_address(
-        token_out), fee, recipient, amount_in, 0, 0]).transact({"from": wallet.address})
+    tx_hash = w3.eth.send_transaction({**swap, "gas": preflight(swap)})
     receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
 
     # print(f"Transaction sent with hash: {receipt}")
     return receipt
 
 
+def simulate_swap(token_in: str, token_out: str, amount_in: int, recipient: str,
+                  slippage_tolerance: float = 0.005):
+    """
+    Simulate a swap (including any approval) on the fork without sending anything.
+    Use this to check a swap will succeed and what it will return before calling swap_tokens.
+
+    Args:
+        token_in (str): Address of the token to swap from.
+        token_out (str): Address of the token to swap to.
+        amount_in (int): Amount of `token_in` to swap (in wei).
+        recipient (str): Address to receive the swapped tokens.
+        slippage_tolerance (float): Maximum allowed slippage as a fraction (e.g., 0.01 for 1%).
+
+    Returns:
+        dict: Success, per-step gas and revert reasons, and the resulting balance changes.
+    """
+    plan = build_swap_plan(token_in, token_out, amount_in, recipient, slippage_tolerance)
+    return simulate_plan(w3, plan, recipient, [token_in, token_out])
+
+
 def add_v3_liquidity(position_manager_address, token0, token1, fee, amount0_desired, amount1_desired, recipient):
     """
     Adds liquidity to a Uniswap V3 pool.
@@ -251,16 +331,21 @@ def add_v3_liquidity(position_manager_address, token0, token1, fee, amount0_desi
     """
     # Load the NonfungiblePositionManager contract
     # Replace with the ABI of the NonfungiblePositionManager contract
-    non_pos_abi = load_abi('non_fungible_position_manager.json')
-    router = w3.eth.contract(address=position_manager_address, abi=non_pos_abi)
+    non_pos_abi = load_abi('./abi/non_fungible_position_manager.json')
+    router = w3.eth.contract(
+        address=Web3.to_checksum_address(position_manager_address), abi=non_pos_abi)
+
+    # Full-range position, rounded to the pool's tick spacing so the mint doesn't revert
+    tick_spacing = {100: 1, 500: 10, 3000: 60, 10000: 200}[fee]
+    max_tick = 887272 // tick_spacing * tick_spacing
 
     # Define parameters for mint function
     params = {
         "token0": Web3.to_checksum_address(token0),
         "token1": Web3.to_checksum_address(token1),
         "fee": fee,
-        "tickLower": -887272,  # Replace with appropriate value
-        "tickUpper": 887272,   # Replace with appropriate value
+        "tickLower": -max_tick,  # Replace with appropriate value
+        "tickUpper": max_tick,   # Replace with appropriate value
         "amount0Desired": amount0_desired,
         "amount1Desired": amount1_desired,
         "amount0Min": 0,       # Adjust as needed to prevent slippage
@@ -270,19 +355,23 @@ def add_v3_liquidity(position_manager_address, token0, token1, fee, amount0_desi
         "deadline": w3.eth.get_block("latest").timestamp + 600,
     }
 
+    # Simulate the mint first, so a bad position fails before it costs gas
+    gas = preflight({
+        "from": wallet.address,
+        "to": router.address,
+        "data": router.encode_abi("mint", args=[params]),
+    })
+
     # Encode the transaction data
     txn = router.functions.mint(params).build_transaction({
         "from": wallet.address,
-        "gas": 3000000,
+        "gas": gas,
         "gasPrice": w3.eth.gas_price,
         "nonce": w3.eth.get_transaction_count(wallet.address),
     })
 
-    # Sign the transaction
-    signed_txn = w3.eth.account.sign_transaction(txn)
-
-    # Send the transaction
-    txn_hash = w3.eth.send_raw_transaction(signed_txn.rawTransaction)
+    # Send the transaction from the node-managed wallet, like the other tools
+    txn_hash = w3.eth.send_transaction(txn)
 
     # Wait for the transaction receipt
     receipt = w3.eth.wait_for_transaction_receipt(txn_hash)
@@ -291,7 +380,7 @@ def add_v3_liquidity(position_manager_address, token0, token1, fee, amount0_desi
 
 
 def remove_v3_liquidity(
-    universal_router_address: str,
+    position_manager_address: str,
     token_id: int,
     liquidity: int,
     amount0_min: int,
@@ -300,52 +389,53 @@ def remove_v3_liquidity(
     deadline: int
 ):
     """
-    Remove liquidity from a Uniswap V3 pool.
+    Remove liquidity from a Uniswap V3 position and collect the tokens it releases.
 
     Args:
-        universal_router_address (str): Address of the Uniswap Universal Router.
+        position_manager_address (str): Address of the NonfungiblePositionManager contract.
         token_id (int): ID of the liquidity position NFT.
-        liquidity (int): Amount of liquidity to burn (in wei).
+        liquidity (int): Amount of liquidity to burn (see the position's `liquidity`).
         amount0_min (int): Minimum amount of `token0` to receive.
         amount1_min (int): Minimum amount of `token1` to receive.
         recipient (str): Address to receive the tokens from the liquidity position.
-        deadline (int): UNIX timestamp for the transaction deadline.
+        deadline (int): UNIX timestamp for the transaction deadline, or 0 for 10 minutes from now.
 
     Returns:
-        str: Transaction hash of the remove liquidity operation.
-    """
-    account = wallet.account
-
-    router_abi = [...]  # Replace with Universal Router ABI
-    universal_router = w3.eth.contract(
-        address=universal_router_address, abi=router_abi)
-
-    remove_liquidity_data = universal_router.encodeABI(
-        fn_name="removeLiquidityV3",
-        args=[
-            {
-                "tokenId": token_id,
-                "liquidity": liquidity,
-                "amount0Min": amount0_min,
-                "amount1Min": amount1_min,
-                "recipient": recipient,
-                "deadline": deadline,
-            }
-        ]
-    )
-
-    transaction = {
-        "to": universal_router_address,
-        "value": 0,
-        "gas": 300000,
-        "gasPrice": w3.eth.gas_price,
-        "nonce": w3.eth.get_transaction_count(account.address),
-        "data": remove_liquidity_data,
+        dict: Transaction receipt.
+    """
+    position_manager = w3.eth.contract(
+        address=Web3.to_checksum_address(position_manager_address),
+        abi=load_abi('./abi/non_fungible_position_manager.json'))
+
+    if not deadline:
+        deadline = w3.eth.get_block("latest").timestamp + 600
+
+    # decreaseLiquidity only credits the tokens to the position, collect sends them out,
+    # so both go in one multicall
+    max_uint128 = 2 ** 128 - 1
+    calls = [
+        position_manager.encode_abi("decreaseLiquidity", args=[{
+            "tokenId": token_id,
+            "liquidity": liquidity,
+            "amount0Min": amount0_min,
+            "amount1Min": amount1_min,
+            "deadline": deadline,
+        }]),
+        position_manager.encode_abi("collect", args=[{
+            "tokenId": token_id,
+            "recipient": Web3.to_checksum_address(recipient),
+            "amount0Max": max_uint128,
+            "amount1Max": max_uint128,
+        }]),
+    ]
+    tx = {
+        "from": wallet.address,
+        "to": position_manager.address,
+        "data": position_manager.encode_abi("multicall", args=[calls]),
     }
 
-    signed_txn = account.sign_transaction(transaction)
-    tx_hash = w3.eth.send_raw_transaction(signed_txn.rawTransaction)
-    return w3.toHex(tx_hash)
+    tx_hash = w3.eth.send_transaction({**tx, "gas": preflight(tx)})
+    return w3.eth.wait_for_transaction_receipt(tx_hash)
 
 
 def supply_asset(
@@ -382,19 +472,21 @@ def supply_asset(
         address=Web3.to_checksum_address(asset), abi=erc20_abi)
 
     # Approve the LendingPool to spend the token
-    approve_txn_hash = w3.eth.send_transaction({
+    approve_txn = {
         "from": wallet.address,
         "to": asset,
         "data": token_contract.encode_abi("approve", args=[lending_pool_address, amount])
-    })
+    }
+    approve_txn_hash = w3.eth.send_transaction({**approve_txn, "gas": preflight(approve_txn)})
     w3.eth.wait_for_transaction_receipt(approve_txn_hash)
 
     # Supply the asset
-    supply_txn_hash = w3.eth.send_transaction({
+    supply_txn = {
         "from": wallet.address,
         "to": lending_pool_address,
         "data": lending_pool.encode_abi("deposit", args=[asset, amount, on_behalf_of, 0])
-    })
+    }
+    supply_txn_hash = w3.eth.send_transaction({**supply_txn, "gas": preflight(supply_txn)})
 
     return w3.to_hex(supply_txn_hash)
 
@@ -424,11 +516,12 @@ def withdraw_asset(
         address=Web3.to_checksum_address(lending_pool_address), abi=lending_pool_abi)
 
     # Send the withdrawal transaction
-    withdraw_txn_hash = w3.eth.send_transaction({
+    withdraw_txn = {
         "from": wallet.address,
         "to": lending_pool_address,
         "data": lending_pool.encode_abi("withdraw", args=[asset, amount, wallet.address])
-    })
+    }
+    withdraw_txn_hash = w3.eth.send_transaction({**withdraw_txn, "gas": preflight(withdraw_txn)})
 
     return w3.to_hex(withdraw_txn_hash)
 
@@ -542,25 +635,103 @@ def get_crypto_context(chain_id: str):
     }
 
 
+price_oracles = {}
+
+
+def get_price_oracle(chain_id: str) -> PriceOracle:
+    """
+    Get the (cached) price oracle for a chain, so pool lookups and per-block prices are reused.
+    """
+    if chain_id not in price_oracles:
+        addresses = get_crypto_context(chain_id)['addresses']
+        wrapped_native = next((addresses[symbol] for symbol in ('WETH', 'WBNB', 'WMATIC')
+                               if symbol in addresses), None)
+        price_oracles[chain_id] = PriceOracle(
+            w3,
+            tokens.get(chain_id, {}),
+            addresses['uniswap']['factory'],
+            wrapped_native)
+    return price_oracles[chain_id]
+
+
+def get_token_prices(chain_id: str, token_addresses: list[str] | None = None, twap_seconds: int = 0):
+    """
+    Get USD prices of whitelisted tokens from the deepest Uniswap V3 pool against WETH or USDC.
+
+    Args:
+        chain_id (str): The chain ID to price tokens on.
+        token_addresses (list[str]): Token addresses to price, or None for every whitelisted token.
+        twap_seconds (int): Time-weighted average window in seconds, or 0 for the current spot price.
+
+    Returns:
+        dict: USD price keyed by token address.
+    """
+    prices = get_price_oracle(chain_id).get_prices(twap_seconds)
+    if token_addresses is None:
+        return prices
+
+    return {address: prices.get(Web3.to_checksum_address(address), 'Not found.')
+            for address in token_addresses}
+
+
+def get_portfolio_value(chain_id: str, address: str, twap_seconds: int = 0):
+    """
+    Value the ETH and whitelisted token balances of a wallet address in USD.
+
+    Args:
+        chain_id (str): The chain ID the wallet is on.
+        address (str): The wallet address to value.
+        twap_seconds (int): Time-weighted average window in seconds, or 0 for the current spot price.
+
+    Returns:
+        dict: Per-token amounts and USD values, plus the total USD value.
+    """
+    if not w3.is_address(address):
+        raise ValueError(f"Invalid Ethereum address: {address}")
+
+    return get_price_oracle(chain_id).get_portfolio_value(address, twap_seconds)
+
+
+def get_pending_transactions():
+    """
+    List transactions that were sent but have no receipt yet, including ones sent before a restart.
+    Check this before repeating an action, so nothing is sent twice.
+
+    Returns:
+        dict: Pending transaction hashes, with the tool and session that sent them.
+    """
+    # Re-checked on every call, so mined and dropped transactions never show up as pending
+    return check_pending_transactions(w3)
+
+
+def serialize_writes(func):
+    # Tools that sign with the wallet (or snapshot the fork) run one at a time
+    return serialize_per_wallet(func, wallet.address)
+
+
 # Create the Based Agent with all available functions
 based_agent = Agent(
     name="Based Agent",
     model="gpt-4o-mini",
     instructions=f"You are a helpful agent we are debugging on forked Ethereum so don't worry about mistakes or errors. We are learning. You can send ETH, swap tokens, add & remove liquidty for a liquidity pool, and add & remove assets for lending in AAVE. If you ever need to know your address, it is {wallet.address}. If you can't find an address or setting there, ask.",
-    functions=[
+    functions=instrument_tools([
         get_eth_balance,
         get_token_balance,
-        send_eth,
-        add_v3_liquidity,
-        remove_v3_liquidity,
-        supply_asset,
-        withdraw_asset,
-        swap_tokens,
+        serialize_writes(send_eth),
+        serialize_writes(add_v3_liquidity),
+        serialize_writes(remove_v3_liquidity),
+        serialize_writes(supply_asset),
+        serialize_writes(withdraw_asset),
+        serialize_writes(swap_tokens),
+        serialize_writes(simulate_swap),
         search_tokens,
         get_crypto_context,
         get_token_data,
-        wrap_eth
-    ],
+        serialize_writes(wrap_eth),
+        get_token_prices,
+        get_portfolio_value,
+        get_pending_transactions
+    ]),
 )
 
 # To add a new function:
@@ -1,12 +1,95 @@
-from fastapi import FastAPI
-from swarm import Swarm
-from agents import based_agent
+import os
+import json
+import asyncio
+from fastapi import FastAPI, HTTPException
 from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from swarm import Swarm
+from agents import based_agent, w3
+from metrics import metrics, instrument_llm, start_trace, trace_summary
+from tool_selection import select_agent, is_read_only
+from admission import AdmissionController
+from state_store import get_store, check_pending_transactions
+import fast_path
 
 app = FastAPI()
-client = Swarm()
+client = instrument_llm(Swarm())
+
+# Chat turns run on a fixed worker pool behind a bounded queue
+admission = AdmissionController(
+    workers=int(os.getenv("API_WORKERS", "4")),
+    max_queue=int(os.getenv("API_MAX_QUEUE", "32")),
+)
+
+# Conversation used when a request has no session_id
+DEFAULT_SESSION = "default"
+
+# Seconds between background re-checks of pending transactions
+PENDING_CHECK_INTERVAL = 60
+background_tasks = []
+
+# Trace events forwarded to streaming clients, and the SSE event name for each
+STREAMED_EVENTS = {
+    "tool_start": "tool_start",
+    "tool": "tool_finish",
+    "transaction": "transaction",
+}
+
+
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
 
-messages = []
+def submit_turn(turn, message: str) -> asyncio.Future:
+    """
+    Queue a chat turn, prioritizing read-only messages. Answers 429 when the queue is full.
+    """
+    try:
+        return admission.submit(turn, read_only=is_read_only(message))
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=429, detail="Too many requests, please retry shortly.") from None
+
+
+def fast_reply(session_id: str, message: str) -> dict | None:
+    """
+    Answer simple lookups directly, without an LLM round trip, and record the exchange.
+    Called before queueing, so lookups never wait behind LLM turns or get a 429.
+    """
+    answer = fast_path.answer(message)
+    if answer is None:
+        return None
+    reply = {"role": "assistant", "content": answer, "sender": "Fast Path"}
+    get_store().add_messages(session_id, [{"role": "user", "content": message}, reply])
+    return reply
+
+
+async def watch_pending_transactions():
+    """
+    Re-check pending transactions in the background, so mined or dropped ones don't linger.
+    """
+    while True:
+        await asyncio.sleep(PENDING_CHECK_INTERVAL)
+        try:
+            await asyncio.to_thread(check_pending_transactions, w3)
+        except Exception as e:
+            print(f"Error checking pending transactions: {e}")
+
+
+@app.on_event("startup")
+async def start_workers():
+    admission.start()
+    # Clear transactions that were mined or dropped while the server was down
+    pending = await asyncio.to_thread(check_pending_transactions, w3)
+    if pending:
+        print(f"Resuming with {len(pending)} pending transaction(s): {', '.join(pending)}")
+    background_tasks.append(asyncio.create_task(watch_pending_transactions()))
+
+
+@app.on_event("shutdown")
+async def stop_workers():
+    for task in background_tasks:
+        task.cancel()
+    await admission.stop()
 
 
 @app.get("/")
@@ -19,19 +102,117 @@ def wallet_info(address: str):
     return {"data": address}
 
 
+@app.get("/metrics")
+def read_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/chat")
-async def process_data(message: str):
+async def process_data(message: str, session_id: str | None = None):
     print("Message received:", message)
-    messages.append({"role": "user", "content": message})
-
-    response = await run_in_threadpool(
-        client.run,  # Pass the blocking function
-        agent=based_agent,
-        messages=messages,
-        context_variables={},
-        stream=False,
-        debug=False,
-    )
-    # print(response)
-    messages.extend(response.messages)
-    return {"result": "Processed", "response": response.messages}
+    session_id = session_id or DEFAULT_SESSION
+    trace = start_trace(session_id)
+
+    reply = await run_in_threadpool(fast_reply, session_id, message)
+    if reply is not None:
+        summary = trace_summary(trace)
+        metrics.observe("chat_latency_seconds", summary["total_seconds"])
+        return {"result": "Processed", "response": [reply], "trace": summary}
+
+    def run_turn():
+        get_store().add_messages(session_id, [{"role": "user", "content": message}])
+        messages = list(get_store().session(session_id))
+        response = client.run(
+            agent=select_agent(based_agent, messages),
+            messages=messages,
+            context_variables={},
+            stream=False,
+            debug=False,
+        )
+        # print(response)
+        get_store().add_messages(session_id, response.messages)
+        return response.messages
+
+    response_messages = await submit_turn(run_turn, message)
+
+    summary = trace_summary(trace)
+    metrics.observe("chat_latency_seconds", summary["total_seconds"])
+    return {"result": "Processed", "response": response_messages, "trace": summary}
+
+
+@app.get("/chat/stream")
+async def stream_chat(message: str, session_id: str | None = None):
+    """
+    Like /chat, but streams server-sent events as the turn progresses: `content` deltas,
+    `tool_call` as the LLM picks a tool, `tool_start`/`tool_finish` with timing,
+    `transaction` hashes as soon as the node accepts them (`simulated` when they are
+    rolled back by a simulation), then `done` with the new messages and trace summary.
+    """
+    print("Message received:", message)
+    session_id = session_id or DEFAULT_SESSION
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def emit(event, data):
+        loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+
+    def on_trace_event(trace_event):
+        if trace_event["kind"] in STREAMED_EVENTS:
+            emit(STREAMED_EVENTS[trace_event["kind"]],
+                 {k: v for k, v in trace_event.items() if k != "kind"})
+
+    trace = start_trace(session_id, listener=on_trace_event)
+
+    reply = await run_in_threadpool(fast_reply, session_id, message)
+    if reply is not None:
+        summary = trace_summary(trace)
+        metrics.observe("chat_latency_seconds", summary["total_seconds"])
+
+        async def fast_events():
+            yield sse("content", {"content": reply["content"], "sender": reply["sender"]})
+            yield sse("done", {"response": [reply], "trace": summary})
+
+        return StreamingResponse(fast_events(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache"})
+
+    def run_turn():
+        get_store().add_messages(session_id, [{"role": "user", "content": message}])
+        messages = list(get_store().session(session_id))
+        try:
+            chunks = client.run(
+                agent=select_agent(based_agent, messages),
+                messages=messages,
+                context_variables={},
+                stream=True,
+                debug=False,
+            )
+            for chunk in chunks:
+                if "response" in chunk:
+                    response = chunk["response"]
+                    get_store().add_messages(session_id, response.messages)
+                    emit("done", {"response": response.messages, "trace": trace_summary(trace)})
+                if chunk.get("content"):
+                    emit("content", {"content": chunk["content"], "sender": chunk.get("sender")})
+                for tool_call in chunk.get("tool_calls") or []:
+                    name = tool_call["function"]["name"]
+                    if name:
+                        emit("tool_call", {"name": name})
+        except Exception as e:
+            emit("error", {"message": str(e)})
+        finally:
+            metrics.observe("chat_latency_seconds", trace_summary(trace)["total_seconds"])
+            emit(None, None)
+
+    # Queued now, so a full queue is a 429 rather than a broken stream
+    worker = submit_turn(run_turn, message)
+
+    async def events():
+        while True:
+            event, data = await queue.get()
+            if event is None:
+                break
+            yield sse(event, data)
+        await worker
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
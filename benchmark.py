@@ -0,0 +1,388 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+
+from web3 import Web3
+from web3.providers import JSONBaseProvider
+
+# Benchmarks for the agent tools and full agent turns, run against a local node
+# with the LLM replaced by scripted responses.
+#
+#   python benchmark.py --record benchmark_rpc.json   # against `anvil` or run_fork.sh
+#   python benchmark.py --replay benchmark_rpc.json   # fully offline
+#   python benchmark.py --replay benchmark_rpc.json --save-baseline
+#
+# Without --save-baseline, results are compared against benchmark_baseline.json and the
+# script exits non-zero if a scenario got slower or started making more RPC calls.
+
+# anvil's first default account, so writes work on a fresh `anvil` or the fork
+ANVIL_PRIVATE_KEY = "0xac0974bec39a17e36ba4a6b4d238ff944bacb478cbed5efcae784d7bf4f2ff80"
+os.environ.setdefault("PRIVATE_KEY", ANVIL_PRIVATE_KEY)
+
+import agents  # noqa: E402
+from metrics import simulating  # noqa: E402
+from simulation import clear_simulation_cache, node_lock  # noqa: E402
+
+BASELINE_PATH = "benchmark_baseline.json"
+
+# Allowed slowdown against the baseline before a scenario counts as a regression
+WALL_TIME_TOLERANCE = 1.25
+
+WETH = "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
+USDC = "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48"
+
+
+class BenchmarkProvider(JSONBaseProvider):
+    """
+    JSON-RPC provider that counts requests and can record them to, or replay them from, a file.
+
+    Replayed responses are matched on (method, params). Repeated identical requests
+    (e.g. eth_blockNumber) get the recorded responses in order, cycling when exhausted.
+    """
+
+    def __init__(self, endpoint_uri: str, record_path: str = None, replay_path: str = None):
+        super().__init__()
+        self.record_path = record_path
+        self.recordings = defaultdict(list)
+        self.positions = defaultdict(int)
+        self.request_count = 0
+        self.upstream = None
+
+        if replay_path:
+            with open(replay_path) as f:
+                self.recordings.update(json.load(f))
+        else:
+            self.upstream = Web3.HTTPProvider(endpoint_uri)
+
+    def make_request(self, method, params):
+        self.request_count += 1
+        key = json.dumps([method, params], default=str, sort_keys=True)
+
+        if self.upstream is None:
+            responses = self.recordings.get(key)
+            if not responses:
+                raise KeyError(f"No recorded response for {method} {params}")
+            response = responses[self.positions[key] % len(responses)]
+            self.positions[key] += 1
+            return response
+
+        response = self.upstream.make_request(method, params)
+        if self.record_path:
+            self.recordings[key].append(json.loads(json.dumps(response, default=str)))
+        return response
+
+    def is_connected(self, show_traceback: bool = False) -> bool:
+        return self.upstream is None or self.upstream.is_connected(show_traceback)
+
+    def save(self):
+        if self.record_path:
+            with open(self.record_path, 'w') as f:
+                json.dump(self.recordings, f)
+
+
+class ScriptedCompletions:
+    """
+    Stand-in for `client.chat.completions` that returns scripted responses instead of calling an LLM.
+
+    Each script step is either a string (assistant content) or a list of (tool name, arguments).
+    """
+
+    def __init__(self, script):
+        self.script = script
+        self.step = 0
+
+    def create(self, **kwargs):
+        from openai.types.chat import ChatCompletion
+
+        reply = self.script[min(self.step, len(self.script) - 1)]
+        self.step += 1
+
+        if isinstance(reply, str):
+            message = {"role": "assistant", "content": reply, "tool_calls": None}
+            finish_reason = "stop"
+        else:
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": f"call_{self.step}_{i}",
+                    "type": "function",
+                    "function": {"name": name, "arguments": json.dumps(arguments)},
+                } for i, (name, arguments) in enumerate(reply)],
+            }
+            finish_reason = "tool_calls"
+
+        return ChatCompletion.model_validate({
+            "id": f"scripted-{self.step}",
+            "object": "chat.completion",
+            "created": 0,
+            "model": kwargs.get("model", "scripted"),
+            "choices": [{"index": 0, "finish_reason": finish_reason, "message": message}],
+        })
+
+
+class ScriptedClient:
+    def __init__(self, script):
+        self.chat = type("Chat", (), {})()
+        self.chat.completions = ScriptedCompletions(script)
+
+
+@contextmanager
+def snapshot():
+    """
+    Roll back every state change a scenario makes, so runs are repeatable.
+    """
+    with node_lock.exclusive():
+        snapshot_id = agents.w3.provider.make_request("evm_snapshot", [])["result"]
+        token = simulating.set(True)
+        try:
+            yield
+        finally:
+            simulating.reset(token)
+            agents.w3.provider.make_request("evm_revert", [snapshot_id])
+
+
+def approve(token: str, spender: str, amount: int):
+    erc20 = agents.w3.eth.contract(address=token, abi=agents.load_abi('./abi/erc20.json'))
+    tx_hash = agents.w3.eth.send_transaction({
+        "from": agents.wallet.address,
+        "to": token,
+        "data": erc20.encode_abi("approve", args=[spender, amount]),
+    })
+    agents.w3.eth.wait_for_transaction_receipt(tx_hash)
+
+
+def run_agent_turn(script, message: str):
+    from swarm import Swarm
+
+    client = Swarm(client=ScriptedClient(script))
+    return client.run(
+        agent=agents.based_agent,
+        messages=[{"role": "user", "content": message}],
+        context_variables={},
+        stream=False,
+    )
+
+
+def balance_scan():
+    address = agents.wallet.address
+    agents.get_eth_balance(address)
+    for token in list(agents.tokens['1'])[:20]:
+        agents.get_token_balance(address, token)
+
+
+def portfolio_value():
+    agents.get_portfolio_value('1', agents.wallet.address)
+
+
+def token_prices():
+    agents.get_token_prices('1')
+
+
+def static_lookups():
+    agents.search_tokens('1')
+    agents.get_token_data('1', USDC)
+    agents.get_crypto_context('1')
+
+
+def send_eth():
+    agents.send_eth(agents.wallet.address, "0x70997970C51812dc3A010C7d01b50e0d17dc79C8", 0.01, 1)
+
+
+def swap():
+    agents.wrap_eth(10 ** 18)
+    agents.swap_tokens(WETH, USDC, 10 ** 18, agents.wallet.address, 0.01, 0)
+
+
+def simulated_swap():
+    agents.wrap_eth(10 ** 18)
+    agents.simulate_swap(WETH, USDC, 10 ** 18, agents.wallet.address)
+
+
+def aave_supply():
+    pool = agents.get_crypto_context('1')['addresses']['aave']['pool']
+    agents.wrap_eth(10 ** 18)
+    agents.supply_asset(pool, WETH, 10 ** 18)
+    agents.withdraw_asset(pool, WETH, 2 ** 256 - 1)
+
+
+def lp_mint():
+    position_manager = agents.get_crypto_context('1')['addresses']['uniswap']['position_manager']
+    agents.wrap_eth(2 * 10 ** 18)
+    agents.swap_tokens(WETH, USDC, 10 ** 18, agents.wallet.address, 0.01, 0)
+    usdc_balance = int(agents.get_token_balance(agents.wallet.address, USDC))
+    approve(WETH, position_manager, 10 ** 18)
+    approve(USDC, position_manager, usdc_balance)
+    # USDC sorts before WETH, so it is token0
+    agents.add_v3_liquidity(position_manager, USDC, WETH, 3000,
+                            usdc_balance, 10 ** 18, agents.wallet.address)
+
+
+def lp_remove():
+    lp_mint()
+    position_manager = agents.w3.eth.contract(
+        address=agents.get_crypto_context('1')['addresses']['uniswap']['position_manager'],
+        abi=agents.load_abi('./abi/non_fungible_position_manager.json'))
+    # The position just minted is the wallet's newest
+    count = position_manager.functions.balanceOf(agents.wallet.address).call()
+    token_id = position_manager.functions.tokenOfOwnerByIndex(agents.wallet.address, count - 1).call()
+    liquidity = position_manager.functions.positions(token_id).call()[7]
+    agents.remove_v3_liquidity(position_manager.address, token_id, liquidity, 0, 0,
+                               agents.wallet.address, 0)
+
+
+def agent_balance_turn():
+    run_agent_turn([
+        [("get_eth_balance", {"address": agents.wallet.address})],
+        "Your balance has been checked.",
+    ], "What's my ETH balance?")
+
+
+def agent_swap_turn():
+    agents.wrap_eth(10 ** 18)
+    run_agent_turn([
+        [("get_crypto_context", {"chain_id": "1"})],
+        [("swap_tokens", {"token_in": WETH, "token_out": USDC, "amount_in": 10 ** 18,
+                          "recipient": agents.wallet.address, "slippage_tolerance": 0.01,
+                          "deadline": 0})],
+        "Swapped 1 WETH for USDC.",
+    ], "Swap 1 WETH to USDC.")
+
+
+SCENARIOS = {
+    "static_lookups": static_lookups,
+    "balance_scan": balance_scan,
+    "token_prices": token_prices,
+    "portfolio_value": portfolio_value,
+    "send_eth": send_eth,
+    "swap": swap,
+    "simulated_swap": simulated_swap,
+    "aave_supply": aave_supply,
+    "lp_mint": lp_mint,
+    "lp_remove": lp_remove,
+    "agent_balance_turn": agent_balance_turn,
+    "agent_swap_turn": agent_swap_turn,
+}
+
+
+def reset_caches():
+    # Every run measures the cold path
+    agents.price_oracles.clear()
+    clear_simulation_cache()
+
+
+def run_scenario(scenario, repeat: int) -> dict:
+    """
+    Run a scenario `repeat` times for timing, then once more under tracemalloc for allocations.
+
+    Returns:
+        dict: Median wall time, RPC calls per run, peak traced memory, and any error.
+    """
+    provider = agents.w3.provider
+    wall_times = []
+    rpc_calls = 0
+    error = None
+
+    for _ in range(repeat + 1):
+        traced = len(wall_times) == repeat
+        reset_caches()
+        if traced:
+            tracemalloc.start()
+
+        with snapshot():
+            start_count = provider.request_count
+            start = time.perf_counter()
+            try:
+                scenario()
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            elapsed = time.perf_counter() - start
+            # Exclude the evm_snapshot call made by the benchmark itself
+            rpc_calls = provider.request_count - start_count
+
+        if traced:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        else:
+            wall_times.append(elapsed)
+
+        if error:
+            break
+
+    return {
+        "wall_seconds": statistics.median(wall_times) if wall_times else None,
+        "rpc_calls": rpc_calls,
+        "peak_kib": peak / 1024 if not error else None,
+        "error": error,
+    }
+
+
+def compare(results: dict, baseline: dict) -> list:
+    """
+    List the scenarios that regressed against the baseline, including ones that now fail.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or base["error"]:
+            continue
+        if result["error"]:
+            regressions.append(f"{name}: now fails with {result['error']}")
+            continue
+        if result["rpc_calls"] > base["rpc_calls"]:
+            regressions.append(f"{name}: {base['rpc_calls']} -> {result['rpc_calls']} RPC calls")
+        if result["wall_seconds"] > base["wall_seconds"] * WALL_TIME_TOLERANCE:
+            regressions.append(
+                f"{name}: {base['wall_seconds'] * 1000:.1f} -> {result['wall_seconds'] * 1000:.1f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark agent tools against a local node.")
+    parser.add_argument("--node", default=agents.provider_url, help="JSON-RPC endpoint (anvil)")
+    parser.add_argument("--record", help="Record RPC traffic to this file")
+    parser.add_argument("--replay", help="Replay RPC traffic from this file instead of a node")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per scenario")
+    parser.add_argument("--scenario", action="append", help="Only run these scenarios")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    provider = BenchmarkProvider(args.node, record_path=args.record, replay_path=args.replay)
+    agents.w3.provider = provider
+
+    results = {}
+    for name in args.scenario or SCENARIOS:
+        results[name] = run_scenario(SCENARIOS[name], args.repeat)
+        result = results[name]
+        if result["error"]:
+            print(f"{name:<20} ERROR {result['error']}")
+        else:
+            print(f"{name:<20} {result['wall_seconds'] * 1000:9.1f} ms "
+                  f"{result['rpc_calls']:5d} rpc {result['peak_kib']:9.1f} KiB peak")
+
+    provider.save()
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f))
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
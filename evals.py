@@ -1,44 +1,188 @@
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
 from swarm import Swarm
-from agents import weather_agent
+from agents import based_agent
+from tool_selection import select_agent
 import pytest
 
-client = Swarm()
+# Tool-selection evals for based_agent, offered the same tool subset
+# select_agent picks in production.
+#
+# LLM responses are cached on disk keyed by the full request (model, system prompt,
+# tool schemas and messages), so unchanged cases replay instantly and offline.
+# Run with `pytest evals.py` or `python evals.py` for a report.
+
+CACHE_DIR = ".eval_cache"
+MAX_WORKERS = int(os.getenv("EVAL_WORKERS", "8"))
+
+WALLET = "0x70997970C51812dc3A010C7d01b50e0d17dc79C8"
+
+# (query, tools the first response may call; empty means no tool call is expected).
+# A tuple query is a conversation of alternating user and assistant turns.
+CASES = [
+    ("What's my ETH balance?", {"get_eth_balance"}),
+    (f"How much ETH does {WALLET} have?", {"get_eth_balance"}),
+    (f"How much USDC (0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48) does {WALLET} hold?",
+     {"get_token_balance"}),
+    ("Which tokens can I use on chain 1?", {"search_tokens"}),
+    ("Get the token data for 0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48 on chain 1.",
+     {"get_token_data"}),
+    ("What's the Aave pool address on Arbitrum (chain 42161)?", {"get_crypto_context"}),
+    ("Wrap 1000000000000000000 wei of ETH into WETH.", {"wrap_eth"}),
+    (f"Send 0.01 ETH to {WALLET} at 1 gwei.", {"send_eth"}),
+    ("Swap 1 WETH for USDC on chain 1.", {"swap_tokens", "simulate_swap", "get_crypto_context",
+                                          "search_tokens", "get_token_data"}),
+    ("What is WETH worth in USD on chain 1?", {"get_token_prices"}),
+    ("What is my wallet worth in USD on chain 1?", {"get_portfolio_value"}),
+    (("Swap 1 WETH for USDC.",
+      "Sure. Which chain should I use, and how much slippage will you accept?",
+      "Use chain 1 with 1% slippage."),
+     {"swap_tokens", "simulate_swap", "get_crypto_context", "search_tokens", "get_token_data"}),
+    ("Hi!", set()),
+    ("What can you do?", set()),
+]
+
+
+class CachedCompletions:
+    """
+    Drop-in for `client.chat.completions` that serves responses from a disk cache,
+    only calling the OpenAI API (created lazily) on a miss.
+
+    Every response is also kept in `calls` as (response, latency, cached) for reporting.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.client = None
+        self.calls = []
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def create(self, **kwargs):
+        from openai import OpenAI
+        from openai.types.chat import ChatCompletion
+
+        key = hashlib.sha256(
+            json.dumps(kwargs, sort_keys=True, default=str).encode()).hexdigest()
+        path = os.path.join(self.cache_dir, f"{key}.json")
+
+        if os.path.exists(path):
+            with open(path) as f:
+                cached = json.load(f)
+            response = ChatCompletion.model_validate(cached["response"])
+            self.calls.append((response, cached["latency"], True))
+            return response
+
+        if self.client is None:
+            self.client = OpenAI()
+
+        start = time.perf_counter()
+        response = self.client.chat.completions.create(**kwargs)
+        latency = time.perf_counter() - start
+
+        # Write then rename, so a concurrent reader never sees a partial entry
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump({"response": response.model_dump(), "latency": latency}, f)
+        os.replace(f"{path}.tmp", path)
+
+        self.calls.append((response, latency, False))
+        return response
+
+
+class CachedClient:
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.chat = type("Chat", (), {})()
+        self.chat.completions = CachedCompletions(cache_dir)
+
 
+def case_messages(query: str | tuple) -> list:
+    """
+    Chat messages for a case, alternating user and assistant turns for a conversation.
+    """
+    turns = (query,) if isinstance(query, str) else query
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": turn}
+            for i, turn in enumerate(turns)]
 
-def run_and_get_tool_calls(agent, query):
-    message = {"role": "user", "content": query}
+
+def case_label(query: str | tuple) -> str:
+    return query if isinstance(query, str) else " / ".join(query)
+
+
+def run_case(query: str | tuple, expected: set) -> dict:
+    """
+    Run one query through based_agent, narrowed by select_agent as /chat does, without executing tools.
+
+    Returns:
+        dict: The tools called, whether that matches `expected`, latency, token usage and cache status.
+    """
+    # One client per case, so its recorded calls belong to this case only
+    completions = CachedClient()
+    client = Swarm(client=completions)
+
+    messages = case_messages(query)
     response = client.run(
-        agent=agent,
-        messages=[message],
+        agent=select_agent(based_agent, messages),
+        messages=messages,
         execute_tools=False,
     )
-    return response.messages[-1].get("tool_calls")
-
-
-@pytest.mark.parametrize(
-    "query",
-    [
-        "What's the weather in NYC?",
-        "Tell me the weather in London.",
-        "Do I need an umbrella today? I'm in chicago.",
-    ],
-)
-def test_calls_weather_when_asked(query):
-    tool_calls = run_and_get_tool_calls(weather_agent, query)
-
-    assert len(tool_calls) == 1
-    assert tool_calls[0]["function"]["name"] == "get_weather"
-
-
-@pytest.mark.parametrize(
-    "query",
-    [
-        "Who's the president of the United States?",
-        "What is the time right now?",
-        "Hi!",
-    ],
-)
-def test_does_not_call_weather_when_not_asked(query):
-    tool_calls = run_and_get_tool_calls(weather_agent, query)
-
-    assert not tool_calls
+    tool_calls = response.messages[-1].get("tool_calls") or []
+    tools = [tool_call["function"]["name"] for tool_call in tool_calls]
+
+    if expected:
+        passed = bool(tools) and all(tool in expected for tool in tools)
+    else:
+        passed = not tools
+
+    completion, latency, cached = completions.chat.completions.calls[-1]
+    usage = completion.usage
+    return {
+        "query": query,
+        "expected": sorted(expected),
+        "tools": tools,
+        "passed": passed,
+        "latency": latency,
+        "cached": cached,
+        "prompt_tokens": usage.prompt_tokens if usage else 0,
+        "completion_tokens": usage.completion_tokens if usage else 0,
+    }
+
+
+def run_cases(cases=CASES, max_workers: int = MAX_WORKERS) -> list:
+    """
+    Run every case concurrently, with at most `max_workers` LLM calls in flight.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda case: run_case(*case), cases))
+
+
+def print_report(results: list):
+    for result in results:
+        status = "PASS" if result["passed"] else "FAIL"
+        source = "cache" if result["cached"] else "live"
+        print(f"{status} {result['latency'] * 1000:7.0f} ms ({source}) "
+              f"{result['prompt_tokens']:5d}+{result['completion_tokens']:<4d} tok "
+              f"{case_label(result['query'])[:60]!r} -> {result['tools']} (expected {result['expected']})")
+
+    passed = sum(result["passed"] for result in results)
+    print(f"\nAccuracy: {passed}/{len(results)} ({passed / len(results):.0%})")
+    print(f"Prompt tokens: {sum(r['prompt_tokens'] for r in results)}, "
+          f"completion tokens: {sum(r['completion_tokens'] for r in results)}")
+    print(f"Cache hits: {sum(r['cached'] for r in results)}/{len(results)}")
+
+
+@pytest.fixture(scope="session")
+def eval_results():
+    return {result["query"]: result for result in run_cases()}
+
+
+@pytest.mark.parametrize("query,expected", CASES, ids=[case_label(case[0]) for case in CASES])
+def test_tool_selection(eval_results, query, expected):
+    result = eval_results[query]
+    assert result["passed"], f"called {result['tools']}, expected one of {sorted(expected)}"
+
+
+if __name__ == "__main__":
+    print_report(run_cases())
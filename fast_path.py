@@ -0,0 +1,140 @@
+import re
+
+from agents import wallet, tokens, get_eth_balance, get_token_data, get_crypto_context
+from metrics import metrics
+
+# Answers a fixed grammar of read-only questions directly from the tools,
+# skipping the LLM round trip. Anything outside the grammar returns None and
+# should go to the agent as usual.
+
+metrics.describe("fast_path_requests_total", "Messages answered by the fast path (hit) or sent to the LLM (miss)")
+
+CHAIN_IDS = {
+    "ethereum": "1",
+    "mainnet": "1",
+    "eth": "1",
+    "optimism": "10",
+    "op": "10",
+    "bsc": "56",
+    "bnb": "56",
+    "bnb chain": "56",
+    "binance smart chain": "56",
+    "polygon": "137",
+    "matic": "137",
+    "base": "8453",
+    "arbitrum": "42161",
+    "arbitrum one": "42161",
+}
+
+# (protocol, contract as asked) -> path in get_crypto_context()['addresses']
+PROTOCOL_CONTRACTS = {
+    ("aave", "pool"): ("aave", "pool"),
+    ("aave", "lending pool"): ("aave", "pool"),
+    ("uniswap", "router"): ("uniswap", "universal_router"),
+    ("uniswap", "universal router"): ("uniswap", "universal_router"),
+    ("uniswap", "factory"): ("uniswap", "factory"),
+    ("uniswap", "position manager"): ("uniswap", "position_manager"),
+}
+
+ADDRESS = r"0x[0-9a-f]{40}"
+ON_CHAIN = r"(?:\s+on\s+(?P<chain>[a-z0-9 ]+?))?"
+WHAT_IS = r"(?:(?:what(?:'s| is)|show(?: me)?|get|check|give me)\s+)?(?:the\s+)?"
+
+BALANCE_PATTERNS = [
+    re.compile(rf"^{WHAT_IS}(?:(?P<my>my)\s+)?(?:eth\s+)?balance(?:\s+(?:of|for)\s+(?P<address>{ADDRESS}))?$"),
+    re.compile(rf"^how much eth (?:do (?P<my>i) have|does (?P<address>{ADDRESS}) have)$"),
+]
+TOKEN_PATTERNS = [
+    re.compile(rf"^{WHAT_IS}(?:contract\s+)?address (?:of|for) (?P<symbol>[a-z0-9.]+){ON_CHAIN}$"),
+    re.compile(rf"^{WHAT_IS}(?P<symbol>[a-z0-9.]+)(?: token| contract)? address{ON_CHAIN}$"),
+]
+PROTOCOL_PATTERNS = [
+    re.compile(rf"^{WHAT_IS}(?P<protocol>aave|uniswap)(?: v3)? (?P<contract>lending pool|pool|universal router|router|factory|position manager)(?: address)?{ON_CHAIN}$"),
+]
+
+
+def parse_chain(name: str | None) -> str | None:
+    """
+    Resolve a chain name or ID from a query, defaulting to mainnet when none is given.
+    """
+    if not name:
+        return "1"
+    name = re.sub(r"^(?:the\s+)|(?:\s+(?:chain|network|mainnet))$", "", name.strip())
+    name = re.sub(r"^chain\s+(?:id\s+)?", "", name)
+    if name in CHAIN_IDS.values():
+        return name
+    return CHAIN_IDS.get(name)
+
+
+def answer_balance(match) -> str | None:
+    address = match.group("address") or (wallet.address if match.group("my") else None)
+    if address is None:
+        return None
+    return f"{address} has {get_eth_balance(address)} ETH."
+
+
+def answer_token(match) -> str | None:
+    chain_id = parse_chain(match.group("chain"))
+    if chain_id is None:
+        return None
+
+    symbol = match.group("symbol").upper()
+    for address, token in tokens.get(chain_id, {}).items():
+        if token["symbol"].upper() == symbol:
+            data = get_token_data(chain_id, address)
+            return (f"{data['symbol']} ({data['name']}) on chain {chain_id} is at {address}, "
+                    f"with {data['decimals']} decimals.")
+    return None
+
+
+def answer_protocol(match) -> str | None:
+    chain_id = parse_chain(match.group("chain"))
+    path = PROTOCOL_CONTRACTS.get((match.group("protocol"), match.group("contract")))
+    if chain_id is None or path is None:
+        return None
+
+    try:
+        addresses = get_crypto_context(chain_id)["addresses"]
+    except KeyError:
+        return None
+
+    protocol, contract = path
+    address = addresses.get(protocol, {}).get(contract)
+    if address is None:
+        return None
+    return f"The {protocol.capitalize()} {contract.replace('_', ' ')} on chain {chain_id} is {address}."
+
+
+INTENTS = [
+    ("eth_balance", BALANCE_PATTERNS, answer_balance),
+    ("token_address", TOKEN_PATTERNS, answer_token),
+    ("protocol_address", PROTOCOL_PATTERNS, answer_protocol),
+]
+
+
+def answer(message: str) -> str | None:
+    """
+    Answer a simple read-only query without the LLM.
+
+    Args:
+        message (str): The user's message.
+
+    Returns:
+        str: The answer, or None if the message is not in the fast-path grammar.
+    """
+    text = re.sub(r"[?!.\s]+$", "", message.strip().lower().replace("’", "'"))
+    text = re.sub(r"\s+", " ", text)
+
+    for intent, patterns, handler in INTENTS:
+        for pattern in patterns:
+            match = pattern.match(text)
+            if match is None:
+                continue
+            result = handler(match)
+            if result is not None:
+                metrics.inc("fast_path_requests_total", {"intent": intent, "result": "hit"})
+                return result
+
+    metrics.inc("fast_path_requests_total", {"intent": "none", "result": "miss"})
+    return None
+
@@ -0,0 +1,326 @@
+import json
+import time
+import uuid
+import bisect
+import functools
+import threading
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional
+
+from web3.middleware import Web3Middleware
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+SIZE_BUCKETS = [256, 1024, 4096, 16384, 65536, 262144, 1048576]
+
+# Name of the agent tool currently executing, so RPC calls can be attributed to it
+current_tool: ContextVar[str] = ContextVar("current_tool", default="none")
+
+# Trace of the request currently being handled, if any
+current_trace: ContextVar[Optional[dict]] = ContextVar("current_trace", default=None)
+
+# Whether transactions sent now will be rolled back by evm_revert (simulations, benchmarks)
+simulating: ContextVar[bool] = ContextVar("simulating", default=False)
+
+
+class Metrics:
+    """
+    A minimal thread-safe registry of counters, gauges and histograms, rendered in the
+    Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[tuple, float] = {}
+        self.gauges: Dict[tuple, float] = {}
+        # (name, labels) -> [bucket counts, sum, count]
+        self.histograms: Dict[tuple, list] = {}
+        self.buckets: Dict[str, List[float]] = {}
+        self.help: Dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str, buckets: List[float] = None):
+        self.help[name] = help_text
+        if buckets is not None:
+            self.buckets[name] = buckets
+
+    def inc(self, name: str, labels: dict = None, value: float = 1):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, labels: dict = None):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            self.gauges[key] = value
+
+    def observe(self, name: str, value: float, labels: dict = None):
+        buckets = self.buckets.get(name, LATENCY_BUCKETS)
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            histogram = self.histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+            index = bisect.bisect_left(buckets, value)
+            if index < len(buckets):
+                histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text format.
+        """
+        def label_str(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self.lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            histograms = {key: [list(h[0]), h[1], h[2]] for key, h in self.histograms.items()}
+
+        for name in sorted({key[0] for key in counters}):
+            lines.append(f"# HELP {name} {self.help.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            for (metric, labels), value in counters.items():
+                if metric == name:
+                    lines.append(f"{name}{label_str(labels)} {value}")
+
+        for name in sorted({key[0] for key in gauges}):
+            lines.append(f"# HELP {name} {self.help.get(name, name)}")
+            lines.append(f"# TYPE {name} gauge")
+            for (metric, labels), value in gauges.items():
+                if metric == name:
+                    lines.append(f"{name}{label_str(labels)} {value}")
+
+        for name in sorted({key[0] for key in histograms}):
+            buckets = self.buckets.get(name, LATENCY_BUCKETS)
+            lines.append(f"# HELP {name} {self.help.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for (metric, labels), (counts, total, count) in histograms.items():
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{label_str(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_bucket{label_str(labels, [('le', '+Inf')])} {count}")
+                lines.append(f"{name}_sum{label_str(labels)} {total}")
+                lines.append(f"{name}_count{label_str(labels)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.describe("rpc_requests_total", "JSON-RPC requests by method and tool")
+metrics.describe("rpc_errors_total", "JSON-RPC responses containing an error")
+metrics.describe("rpc_latency_seconds", "JSON-RPC round trip latency")
+metrics.describe("rpc_request_bytes", "JSON-RPC request params size", SIZE_BUCKETS)
+metrics.describe("rpc_response_bytes", "JSON-RPC response size", SIZE_BUCKETS)
+metrics.describe("tool_calls_total", "Agent tool calls by tool and outcome")
+metrics.describe("tool_latency_seconds", "Agent tool execution time")
+metrics.describe("llm_requests_total", "LLM completion requests by model")
+metrics.describe("llm_latency_seconds", "LLM completion latency (time to last token)")
+metrics.describe("llm_first_token_seconds", "LLM time to first streamed chunk")
+metrics.describe("llm_tokens_total", "LLM tokens used by model and kind")
+metrics.describe("chat_latency_seconds", "End-to-end /chat latency")
+metrics.describe("queue_depth", "Chat requests waiting for a worker")
+metrics.describe("queue_wait_seconds", "Time chat requests spent queued before a worker picked them up")
+metrics.describe("queue_rejected_total", "Chat requests rejected with 429 because the queue was full")
+metrics.describe("wallet_lock_wait_seconds", "Time write tools waited for their wallet to be free")
+
+
+def record(kind: str, **fields):
+    """
+    Append an event to the current request's trace, if one is active,
+    and pass it to the trace's listener (e.g. a streaming response).
+    """
+    trace = current_trace.get()
+    if trace is not None:
+        event = {"kind": kind, "tool": current_tool.get(), **fields}
+        trace["events"].append(event)
+        if trace.get("listener"):
+            trace["listener"](event)
+
+
+class RPCMetricsMiddleware(Web3Middleware):
+    """
+    Web3 middleware that counts and times every JSON-RPC request, tagged with the
+    agent tool that issued it.
+    """
+
+    def wrap_make_request(self, make_request):
+        def middleware(method, params):
+            start = time.perf_counter()
+            response = make_request(method, params)
+            elapsed = time.perf_counter() - start
+
+            labels = {"method": method, "tool": current_tool.get()}
+            metrics.inc("rpc_requests_total", labels)
+            metrics.observe("rpc_latency_seconds", elapsed, labels)
+            metrics.observe("rpc_request_bytes",
+                            len(json.dumps(params, default=str)), labels)
+            metrics.observe("rpc_response_bytes",
+                            len(json.dumps(response, default=str)), labels)
+            if "error" in response:
+                metrics.inc("rpc_errors_total", labels)
+
+            record("rpc", method=method, seconds=elapsed)
+            if method in ("eth_sendTransaction", "eth_sendRawTransaction") and "result" in response:
+                # Known as soon as the node accepts it, long before the receipt
+                record("transaction", hash=response["result"], simulated=simulating.get())
+            return response
+
+        return middleware
+
+
+def instrument_tool(func: Callable) -> Callable:
+    """
+    Wrap an agent function so its calls are timed and the RPCs it makes are attributed to it.
+
+    functools.wraps keeps the name, docstring and signature Swarm builds the tool schema from.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        record("tool_start", name=func.__name__)
+        token = current_tool.set(func.__name__)
+        start = time.perf_counter()
+        status = "error"
+        try:
+            result = func(*args, **kwargs)
+            status = "ok"
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            current_tool.reset(token)
+            labels = {"tool": func.__name__}
+            metrics.inc("tool_calls_total", {**labels, "status": status})
+            metrics.observe("tool_latency_seconds", elapsed, labels)
+            record("tool", name=func.__name__, status=status, seconds=elapsed)
+
+    return wrapper
+
+
+def instrument_tools(functions: List[Callable]) -> List[Callable]:
+    return [instrument_tool(func) for func in functions]
+
+
+def record_usage(model: str, usage):
+    if usage is None:
+        return
+    metrics.inc("llm_tokens_total", {"model": model, "kind": "prompt"}, usage.prompt_tokens)
+    metrics.inc("llm_tokens_total", {"model": model, "kind": "completion"}, usage.completion_tokens)
+    record("llm_tokens", model=model, prompt_tokens=usage.prompt_tokens,
+           completion_tokens=usage.completion_tokens)
+
+
+def instrument_llm(client):
+    """
+    Time every chat completion a Swarm client makes and count its tokens.
+
+    Args:
+        client (Swarm): The Swarm client to instrument. Its OpenAI client is patched in place.
+
+    Returns:
+        Swarm: The same client.
+    """
+    completions = client.client.chat.completions
+    create = completions.create
+
+    def timed_stream(stream, model, start):
+        first = True
+        for chunk in stream:
+            if first:
+                metrics.observe("llm_first_token_seconds",
+                                time.perf_counter() - start, {"model": model})
+                first = False
+            record_usage(model, getattr(chunk, "usage", None))
+            # The usage chunk has no choices, which Swarm doesn't expect
+            if chunk.choices:
+                yield chunk
+        elapsed = time.perf_counter() - start
+        metrics.observe("llm_latency_seconds", elapsed, {"model": model})
+        record("llm", model=model, seconds=elapsed, stream=True)
+
+    @functools.wraps(create)
+    def timed_create(*args, **kwargs):
+        model = kwargs.get("model", "unknown")
+        metrics.inc("llm_requests_total", {"model": model})
+        if kwargs.get("stream"):
+            # Streamed completions only report usage when asked to, in a final extra chunk
+            kwargs.setdefault("stream_options", {"include_usage": True})
+
+        start = time.perf_counter()
+        response = create(*args, **kwargs)
+
+        if kwargs.get("stream"):
+            return timed_stream(response, model, start)
+
+        elapsed = time.perf_counter() - start
+        metrics.observe("llm_latency_seconds", elapsed, {"model": model})
+        record("llm", model=model, seconds=elapsed, stream=False)
+        record_usage(model, response.usage)
+        return response
+
+    completions.create = timed_create
+    return client
+
+
+def start_trace(session_id: str = None, listener: Callable = None) -> dict:
+    """
+    Start a trace for the current request. Events recorded in this context are collected in it.
+
+    Args:
+        session_id (str): Optional session ID to tag the trace with.
+        listener (Callable): Optional callback invoked with each event as it is recorded.
+    """
+    trace = {
+        "request_id": uuid.uuid4().hex,
+        "session_id": session_id,
+        "start": time.perf_counter(),
+        "events": [],
+        "listener": listener,
+    }
+    current_trace.set(trace)
+    return trace
+
+
+def trace_summary(trace: dict) -> dict:
+    """
+    Summarize where a request spent its time: LLM, tools and RPCs (per tool and method).
+    """
+    total = time.perf_counter() - trace["start"]
+    summary = {
+        "request_id": trace["request_id"],
+        "session_id": trace["session_id"],
+        "total_seconds": total,
+        "llm": {"calls": 0, "seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0},
+        "tools": {},
+        "rpc": {"calls": 0, "seconds": 0.0, "by_method": {}},
+    }
+
+    for event in trace["events"]:
+        if event["kind"] == "llm":
+            summary["llm"]["calls"] += 1
+            summary["llm"]["seconds"] += event["seconds"]
+        elif event["kind"] == "llm_tokens":
+            summary["llm"]["prompt_tokens"] += event["prompt_tokens"]
+            summary["llm"]["completion_tokens"] += event["completion_tokens"]
+        elif event["kind"] == "tool":
+            tool = summary["tools"].setdefault(
+                event["name"], {"calls": 0, "seconds": 0.0, "rpc_calls": 0})
+            tool["calls"] += 1
+            tool["seconds"] += event["seconds"]
+        elif event["kind"] == "rpc":
+            summary["rpc"]["calls"] += 1
+            summary["rpc"]["seconds"] += event["seconds"]
+            method = summary["rpc"]["by_method"].setdefault(
+                event["method"], {"calls": 0, "seconds": 0.0})
+            method["calls"] += 1
+            method["seconds"] += event["seconds"]
+            if event["tool"] != "none":
+                tool = summary["tools"].setdefault(
+                    event["tool"], {"calls": 0, "seconds": 0.0, "rpc_calls": 0})
+                tool["rpc_calls"] += 1
+
+    return summary
@@ -0,0 +1,66 @@
+import json
+from typing import List, Optional, Tuple
+
+from web3 import Web3
+
+# Multicall3 is deployed at the same address on every chain we support
+# https://github.com/mds1/multicall
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+# Keep each eth_call comfortably below typical node request size limits
+DEFAULT_BATCH_SIZE = 1000
+
+with open('./abi/multicall3.json') as f:
+    multicall3_abi = json.load(f)
+
+
+def block_hash(w3, block_identifier="latest") -> str:
+    """
+    Resolve a block number or tag to the block's hash.
+
+    Key per-block caches by hash rather than number: after an evm_revert or a reorg the
+    same number can name a different block.
+
+    Args:
+        w3 (Web3): The Web3 instance to use.
+        block_identifier: Block number, tag or hash.
+
+    Returns:
+        str: The 0x-prefixed block hash.
+    """
+    if isinstance(block_identifier, str) and len(block_identifier) == 66:
+        return block_identifier
+    return Web3.to_hex(w3.eth.get_block(block_identifier)["hash"])
+
+
+def multicall(
+    w3,
+    calls: List[Tuple[str, bytes]],
+    block_identifier="latest",
+    batch_size: int = DEFAULT_BATCH_SIZE
+) -> List[Optional[bytes]]:
+    """
+    Execute many read-only contract calls in as few eth_calls as possible.
+
+    Args:
+        w3 (Web3): The Web3 instance to use.
+        calls (list): (target address, calldata) pairs.
+        block_identifier: Block number, tag or hash to read at, so every batch sees the same state.
+        batch_size (int): Maximum number of calls per eth_call.
+
+    Returns:
+        list: Raw return data for each call, or None where the call reverted or returned nothing.
+    """
+    contract = w3.eth.contract(address=MULTICALL3_ADDRESS, abi=multicall3_abi)
+
+    results: List[Optional[bytes]] = []
+    for start in range(0, len(calls), batch_size):
+        batch = [(target, True, data)
+                 for target, data in calls[start:start + batch_size]]
+        response = contract.functions.aggregate3(batch).call(
+            block_identifier=block_identifier)
+        # Calls to addresses without code "succeed" with empty return data
+        results.extend(bytes(data) if success and data else None
+                       for success, data in response)
+
+    return results
@@ -0,0 +1,309 @@
+import json
+from typing import Dict, List, Optional
+
+import numpy as np
+from web3 import Web3
+
+from multicall import block_hash, multicall
+
+# Uniswap V3 fee tiers searched for each token/quote pair
+FEE_TIERS = [100, 500, 3000, 10000]
+
+# Quote assets every token is priced against, in lookup order
+QUOTE_SYMBOLS = ['WETH', 'USDC']
+
+Q96 = float(2 ** 96)
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+
+
+def load_abi(file_path: str):
+    with open(file_path, 'r') as file:
+        return json.load(file)
+
+
+class PriceOracle:
+    """
+    Derives USD token prices from the deepest Uniswap V3 pool per token
+    against WETH or USDC.
+
+    All pool reads go through Multicall3, so pricing the whole token list costs
+    one eth_call for the pool states (plus a one-off one for pool discovery).
+    Results are cached per block hash, and the maths runs as one NumPy pass.
+    """
+
+    def __init__(self, w3, chain_tokens: Dict[str, dict], factory_address: str,
+                 wrapped_native: Optional[str] = None):
+        """
+        Args:
+            w3 (Web3): The Web3 instance to read from.
+            chain_tokens (dict): Token metadata for one chain, keyed by address (see tokens.json).
+            factory_address (str): Address of the Uniswap V3 factory on that chain.
+            wrapped_native (str): Address of the chain's wrapped native token (WETH, WBNB, WMATIC),
+                used to value native balances.
+        """
+        self.w3 = w3
+        self.tokens = {Web3.to_checksum_address(address): token
+                       for address, token in chain_tokens.items()}
+
+        by_symbol = {token['symbol']: address
+                     for address, token in self.tokens.items()}
+        self.quotes = [by_symbol[symbol]
+                       for symbol in QUOTE_SYMBOLS if symbol in by_symbol]
+        self.usdc = by_symbol.get('USDC')
+        self.wrapped_native = Web3.to_checksum_address(wrapped_native) if wrapped_native else None
+
+        self.factory = w3.eth.contract(
+            address=Web3.to_checksum_address(factory_address),
+            abi=load_abi('./abi/uniswap_factory.json'))
+        pool_contract = w3.eth.contract(
+            address=ZERO_ADDRESS, abi=load_abi('./abi/uniswap_pool.json'))
+
+        # These calls take no per-pool arguments, so encode them once
+        self.slot0_data = Web3.to_bytes(hexstr=pool_contract.encode_abi("slot0"))
+        self.liquidity_data = Web3.to_bytes(hexstr=pool_contract.encode_abi("liquidity"))
+        self.pool_contract = pool_contract
+
+        # (token, quote, pool address) for every existing pool, filled on first use
+        self.pools: Optional[List[tuple]] = None
+        self.cache: Dict[tuple, Dict[str, float]] = {}
+        self.cache_block: Optional[str] = None
+
+    def discover_pools(self) -> List[tuple]:
+        """
+        Look up every (token, quote, fee tier) pool in a single multicall.
+
+        Returns:
+            list: (token, quote, pool address) tuples for pools that exist.
+        """
+        candidates = [(token, quote, fee)
+                      for token in self.tokens
+                      for quote in self.quotes if token != quote
+                      for fee in FEE_TIERS]
+        calls = [(self.factory.address,
+                  Web3.to_bytes(hexstr=self.factory.encode_abi("getPool", args=[token, quote, fee])))
+                 for token, quote, fee in candidates]
+
+        pools = []
+        for (token, quote, _), data in zip(candidates, multicall(self.w3, calls)):
+            if data is None:
+                continue
+            pool = self.w3.codec.decode(['address'], data)[0]
+            if int(pool, 16) != 0:
+                pools.append((token, quote, Web3.to_checksum_address(pool)))
+
+        self.pools = pools
+        return pools
+
+    def get_prices(self, twap_seconds: int = 0, block_identifier=None) -> Dict[str, float]:
+        """
+        Price every known token in USD.
+
+        Args:
+            twap_seconds (int): TWAP window in seconds, or 0 for the slot0 spot price.
+            block_identifier: Block number, tag or hash to price at. Defaults to the latest block.
+
+        Returns:
+            dict: USD price keyed by checksummed token address. Tokens without a pool are omitted.
+        """
+        # Keyed by hash: a reverted simulation or a reorg can reuse the block number
+        if block_identifier is None:
+            block_identifier = "latest"
+        block_identifier = block_hash(self.w3, block_identifier)
+
+        if block_identifier != self.cache_block:
+            self.cache = {}
+            self.cache_block = block_identifier
+
+        key = (twap_seconds,)
+        if key in self.cache:
+            return self.cache[key]
+
+        if self.pools is None:
+            self.discover_pools()
+
+        prices = self.compute_prices(
+            self.read_pools(twap_seconds, block_identifier), twap_seconds)
+        self.cache[key] = prices
+        return prices
+
+    def read_pools(self, twap_seconds: int, block_identifier) -> List[tuple]:
+        """
+        Read slot0, liquidity and (optionally) observe for every pool in one multicall.
+
+        Returns:
+            list: (token, quote, sqrtPriceX96, liquidity, twap tick) tuples for pools that answered.
+        """
+        per_pool = [self.slot0_data, self.liquidity_data]
+        if twap_seconds:
+            per_pool.append(Web3.to_bytes(hexstr=self.pool_contract.encode_abi(
+                "observe", args=[[twap_seconds, 0]])))
+
+        calls = [(pool, data) for _, _, pool in self.pools for data in per_pool]
+        results = multicall(self.w3, calls, block_identifier=block_identifier)
+
+        states = []
+        width = len(per_pool)
+        for i, (token, quote, _) in enumerate(self.pools):
+            slot0, liquidity, *observe = results[i * width:(i + 1) * width]
+            if slot0 is None or liquidity is None:
+                continue
+
+            sqrt_price_x96 = self.w3.codec.decode(['uint160'], slot0[:32])[0]
+            liquidity = self.w3.codec.decode(['uint128'], liquidity)[0]
+            if sqrt_price_x96 == 0 or liquidity == 0:
+                continue
+
+            tick = None
+            if observe:
+                # Pools without enough observation history revert with "OLD"
+                if observe[0] is None:
+                    continue
+                cumulatives, _ = self.w3.codec.decode(
+                    ['int56[]', 'uint160[]'], observe[0])
+                tick = (cumulatives[1] - cumulatives[0]) / twap_seconds
+
+            states.append((token, quote, sqrt_price_x96, liquidity, tick))
+
+        return states
+
+    def compute_prices(self, states: List[tuple], twap_seconds: int) -> Dict[str, float]:
+        """
+        Turn raw pool states into USD prices, choosing the deepest pool per token.
+        """
+        if not states:
+            return {}
+
+        addresses = list(self.tokens)
+        index = {address: i for i, address in enumerate(addresses)}
+        decimals = np.array([self.tokens[a]['decimals'] for a in addresses], dtype=float)
+
+        token_idx = np.array([index[s[0]] for s in states])
+        quote_idx = np.array([index[s[1]] for s in states])
+        sqrt_price = np.array([float(s[2]) for s in states]) / Q96
+        liquidity = np.array([float(s[3]) for s in states])
+
+        # Uniswap orders pool tokens by address
+        token_is_0 = np.array([int(s[0], 16) < int(s[1], 16) for s in states])
+        dec0 = np.where(token_is_0, decimals[token_idx], decimals[quote_idx])
+        dec1 = np.where(token_is_0, decimals[quote_idx], decimals[token_idx])
+
+        if twap_seconds:
+            raw_price = np.power(1.0001, np.array([s[4] for s in states]))
+        else:
+            raw_price = sqrt_price ** 2
+        # token1 per token0, in whole units
+        price_1_per_0 = raw_price * np.power(10.0, dec0 - dec1)
+        price_in_quote = np.where(token_is_0, price_1_per_0, 1.0 / price_1_per_0)
+
+        # Virtual reserve of the priced token, so depth is comparable across its pools
+        depth = np.where(token_is_0, liquidity / sqrt_price, liquidity * sqrt_price)
+
+        # Deepest pool per token: sort by token then depth, keep the last of each run
+        order = np.lexsort((depth, token_idx))
+        last = np.append(token_idx[order][1:] != token_idx[order][:-1], True)
+        best = order[last]
+
+        usd = np.full(len(addresses), np.nan)
+        if self.usdc is not None:
+            usd[index[self.usdc]] = 1.0
+
+        # Tokens quoted in USDC first, then tokens quoted in WETH once WETH is priced
+        quote_usd = usd[quote_idx[best]]
+        for _ in range(2):
+            usd[token_idx[best]] = np.where(
+                np.isnan(usd[token_idx[best]]),
+                price_in_quote[best] * quote_usd,
+                usd[token_idx[best]])
+            quote_usd = usd[quote_idx[best]]
+
+        return {address: float(price)
+                for address, price in zip(addresses, usd) if not np.isnan(price)}
+
+    def get_portfolio_value(self, address: str, twap_seconds: int = 0) -> dict:
+        """
+        Value the native balance and every known token held by an address.
+
+        Balances are read in the same block as prices, with one multicall.
+
+        Args:
+            address (str): Wallet address to value.
+            twap_seconds (int): TWAP window in seconds, or 0 for the slot0 spot price.
+
+        Returns:
+            dict: Per-token balances and USD values, plus the total.
+        """
+        owner = Web3.to_checksum_address(address)
+        latest = self.w3.eth.get_block("latest")
+        block = Web3.to_hex(latest["hash"])
+        prices = self.get_prices(twap_seconds, block_identifier=block)
+
+        priced = [token for token in self.tokens if token in prices]
+        erc20 = self.w3.eth.contract(
+            address=ZERO_ADDRESS, abi=load_abi('./abi/erc20.json'))
+        balance_data = Web3.to_bytes(hexstr=erc20.encode_abi("balanceOf", args=[owner]))
+        results = multicall(self.w3, [(token, balance_data) for token in priced],
+                            block_identifier=block)
+
+        raw = np.array([float(self.w3.codec.decode(['uint256'], data)[0]) if data else 0.0
+                        for data in results])
+        decimals = np.array([self.tokens[token]['decimals'] for token in priced], dtype=float)
+        price = np.array([prices[token] for token in priced])
+        amounts = raw / np.power(10.0, decimals)
+        values = amounts * price
+
+        holdings = {}
+        for token, amount, value in zip(priced, amounts, values):
+            if amount > 0:
+                holdings[token] = {
+                    "symbol": self.tokens[token]['symbol'],
+                    "amount": float(amount),
+                    "usd_value": float(value),
+                }
+
+        # Native balance is valued at the wrapped native token's price (WBNB on BSC, not bridged WETH)
+        native = float(self.w3.from_wei(
+            self.w3.eth.get_balance(owner, block_identifier=block), 'ether'))
+        native_price = prices.get(self.wrapped_native, 0.0)
+
+        return {
+            "block": latest["number"],
+            "native": {"amount": native, "usd_value": native * native_price},
+            "tokens": holdings,
+            "total_usd": float(values.sum()) + native * native_price,
+        }
+
+    def min_amount_out(
+        self,
+        token_in: str,
+        token_out: str,
+        amount_in: int,
+        slippage_tolerance: float,
+        twap_seconds: int = 0
+    ) -> int:
+        """
+        Minimum acceptable output for a swap, based on oracle prices.
+
+        With a TWAP window, tokens whose pools have too little observation history
+        (observe reverts) fall back to the spot price.
+
+        Args:
+            token_in (str): Address of the token to swap from.
+            token_out (str): Address of the token to swap to.
+            amount_in (int): Amount of `token_in` to swap (in wei).
+            slippage_tolerance (float): Maximum allowed slippage as a fraction (e.g., 0.01 for 1%).
+            twap_seconds (int): TWAP window in seconds, or 0 for the slot0 spot price.
+
+        Returns:
+            int: Minimum amount of `token_out` (in wei), or 0 if either token cannot be priced.
+        """
+        token_in = Web3.to_checksum_address(token_in)
+        token_out = Web3.to_checksum_address(token_out)
+        prices = self.get_prices(twap_seconds)
+        if twap_seconds:
+            prices = {**self.get_prices(0), **prices}
+        if token_in not in prices or token_out not in prices:
+            return 0
+
+        value_in = amount_in / 10 ** self.tokens[token_in]['decimals'] * prices[token_in]
+        amount_out = value_in / prices[token_out] * (1 - slippage_tolerance)
+        return int(amount_out * 10 ** self.tokens[token_out]['decimals'])
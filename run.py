@@ -1,46 +1,92 @@
-import time
+import os
 import json
 from swarm import Swarm
 from swarm.repl import run_demo_loop
-from agents import based_agent
+from agents import based_agent, w3, wallet, tokens, get_price_oracle
+from scheduler import AgentTask, EventScheduler
+from tool_selection import select_agent
+from metrics import instrument_tool
+from state_store import get_store, check_pending_transactions
 from openai import OpenAI
 
 
 
 # this is the main loop that runs the agent in autonomous mode
 # you can modify this to change the behavior of the agent
-# the interval is the number of seconds between each thought
-def run_autonomous_loop(agent, interval=10):
+# instead of waking on a timer, the agent acts when something happens:
+# a balance change, a price move beyond price_threshold, or a Twitter mention
+def run_autonomous_loop(agent, price_threshold=0.01):
     client = Swarm()
-    messages = []
-    
+
     print("Starting autonomous Based Agent loop...")
-    
-    while True:
-        # Generate a thought
-        thought = (
-            "Be creative and do something interesting on the Base blockchain. "
-            "Don't take any more input from me. Choose an action and execute it now. Choose those that highlight your identity and abilities best."
-        )
-        messages.append({"role": "user", "content": thought})
-        
-        print(f"\n\033[90mAgent's Thought:\033[0m {thought}")
-        
-        # Run the agent to generate a response and take action
+
+    thought = (
+        "Be creative and do something interesting on the Base blockchain. "
+        "Don't take any more input from me. Choose an action and execute it now. Choose those that highlight your identity and abilities best."
+    )
+
+    # Mentions wake the agent up, so give it a way to answer them
+    mentions = load_mention_ingestor()
+    if mentions is not None:
+        agent = agent.model_copy(
+            update={"functions": agent.functions + [instrument_tool(mentions.queue_reply)]})
+
+    # Add more tasks to run several agents in one process. The tools all sign with the
+    # node-managed `wallet`, so every task acts for wallet.address
+    watched = [address for address, token in tokens['1'].items()
+               if token['symbol'] in ('WETH', 'USDC')]
+    tasks = [AgentTask("based", agent, wallet.address, tokens=watched, prompt=thought)]
+
+    # Pick up the conversation, and any transactions still in flight, from the last run
+    store = get_store()
+    for task in tasks:
+        task.messages = list(store.session(task.name))
+    pending = check_pending_transactions(w3)
+    if pending:
+        print(f"Waiting on {len(pending)} transaction(s) sent before the restart: {', '.join(pending)}")
+
+    def run_tick(task, prompt):
+        task.messages.append({"role": "user", "content": prompt})
+        store.add_messages(task.name, [task.messages[-1]])
+
+        print(f"\n\033[90m{task.name} thought:\033[0m {prompt}")
+
+        # Run the agent to generate a response and take action. Tools are picked from the
+        # standing prompt, not the event list, whose "balance"/"price" wording would narrow
+        # the agent to read-only tools
         response = client.run(
-            agent=agent,
-            messages=messages,
-            stream=True
+            agent=select_agent(task.agent, [{"role": "user", "content": task.prompt}]),
+            messages=task.messages,
         )
-        
-        # Process and print the streaming response
-        response_obj = process_and_print_streaming_response(response)
-        
+
+        pretty_print_messages(response.messages)
+
         # Update messages with the new response
-        messages.extend(response_obj.messages)
-        
-        # Wait for the specified interval
-        time.sleep(interval)
+        task.messages.extend(response.messages)
+        store.add_messages(task.name, response.messages)
+
+    scheduler = EventScheduler(
+        w3,
+        tasks,
+        run_tick,
+        get_prices=lambda block: get_price_oracle('1').get_prices(block_identifier=block),
+        get_mentions=mentions.poll if mentions is not None else None,
+        price_threshold=price_threshold,
+        store=store,
+    )
+    scheduler.run()
+
+
+def load_mention_ingestor():
+    """Read and reply to Twitter mentions if credentials are configured, otherwise ignore mentions."""
+    keys = ["TWITTER_API_KEY", "TWITTER_API_SECRET", "TWITTER_ACCESS_TOKEN", "TWITTER_ACCESS_TOKEN_SECRET"]
+    if not all(os.getenv(key) for key in keys):
+        return None
+
+    from twitter_utils import TwitterBot, MentionIngestor
+    bot = TwitterBot(*(os.getenv(key) for key in keys))
+    # Only new mentions, checkpointed across restarts
+    return MentionIngestor(bot)
 
 def choose_mode():
     while True:
@@ -62,37 +108,6 @@ def choose_mode():
         print("Invalid choice. Please try again.")
 
 # Boring stuff to make the logs pretty
-def process_and_print_streaming_response(response):
-    content = ""
-    last_sender = ""
-
-    for chunk in response:
-        if "sender" in chunk:
-            last_sender = chunk["sender"]
-
-        if "content" in chunk and chunk["content"] is not None:
-            if not content and last_sender:
-                print(f"\033[94m{last_sender}:\033[0m", end=" ", flush=True)
-                last_sender = ""
-            print(chunk["content"], end="", flush=True)
-            content += chunk["content"]
-
-        if "tool_calls" in chunk and chunk["tool_calls"] is not None:
-            for tool_call in chunk["tool_calls"]:
-                f = tool_call["function"]
-                name = f["name"]
-                if not name:
-                    continue
-                print(f"\033[94m{last_sender}: \033[95m{name}\033[0m()")
-
-        if "delim" in chunk and chunk["delim"] == "end" and content:
-            print()  # End of response message
-            content = ""
-
-        if "response" in chunk:
-            return chunk["response"]
-
-
 def pretty_print_messages(messages) -> None:
     for message in messages:
         if message["role"] != "assistant":
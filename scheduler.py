@@ -0,0 +1,283 @@
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from web3 import Web3
+
+from metrics import metrics
+from simulation import get_balances
+
+metrics.describe("scheduler_events_total", "Events seen by the autonomous scheduler by kind")
+metrics.describe("scheduler_ticks_total", "Autonomous agent ticks run or skipped because state was unchanged")
+
+
+class AgentTask:
+    """
+    One autonomous agent with its own history and view of on-chain state. `address` is the
+    address whose balances it watches; its tools act for the process wallet.
+    """
+
+    def __init__(self, name: str, agent, address: str, tokens: List[str] = None, prompt: str = ""):
+        self.name = name
+        self.agent = agent
+        self.address = address
+        self.tokens = tokens or []
+        self.prompt = prompt
+        self.messages = []
+
+        # Latest observed state, which the digest is computed from. Mentions are
+        # cleared once a tick has seen them
+        self.balances = {}
+        self.price_refs = {}
+        self.mentions = []
+
+        self.pending = []
+        self.first_event_at = None
+        self.last_event_at = None
+        self.last_tick_at = 0.0
+        self.last_digest = None
+        self.running = False
+
+    def add_event(self, event: dict, now: float):
+        self.pending.append(event)
+        self.first_event_at = self.first_event_at or now
+        self.last_event_at = now
+
+    def checkpoint(self) -> dict:
+        """The state a restarted scheduler needs to pick up where this task left off"""
+        return {
+            "balances": self.balances,
+            "price_refs": self.price_refs,
+            "mentions": self.mentions,
+            "last_digest": self.last_digest,
+        }
+
+    def restore(self, checkpoint: dict):
+        self.balances = checkpoint["balances"]
+        self.price_refs = checkpoint.get("price_refs", {})
+        self.mentions = checkpoint["mentions"]
+        self.last_digest = checkpoint["last_digest"]
+
+    def digest(self, price_refs: dict = None, mentions: list = None) -> str:
+        """Hash of the observed state, or of the current balances with the given prices and mentions"""
+        state = {
+            "balances": self.balances,
+            "prices": self.price_refs if price_refs is None else price_refs,
+            "mentions": [mention["id"] for mention in (self.mentions if mentions is None else mentions)],
+        }
+        return hashlib.sha256(json.dumps(state, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class EventScheduler:
+    """
+    Runs agent ticks when something happens instead of on a fixed timer.
+
+    Every `poll_interval` seconds it checks for a new block. On a new block it re-reads
+    each task's balances and watched token prices. Mentions are polled every
+    `mention_interval` seconds. Changes become events: balance changes not caused by
+    the task's own ticks, prices moving `price_threshold` from the last reported price,
+    and new mentions. Events for a task are coalesced until `debounce` seconds pass with
+    no new event (or `max_delay` since the first one), and a tick only runs if the task's
+    state digest differs from its last tick.
+    Ticks for different tasks run concurrently, at most one per task at a time.
+    """
+
+    def __init__(
+        self,
+        w3,
+        tasks: List[AgentTask],
+        run_tick: Callable[[AgentTask, str], None],
+        get_prices: Optional[Callable[[int], dict]] = None,
+        get_mentions: Optional[Callable[[], list]] = None,
+        poll_interval: float = 2,
+        debounce: float = 5,
+        max_delay: float = 30,
+        min_interval: float = 10,
+        price_threshold: float = 0.01,
+        mention_interval: float = 60,
+        store=None,
+    ):
+        """
+        Args:
+            w3 (Web3): The Web3 instance to watch.
+            tasks (list): The agent tasks to schedule.
+            run_tick (Callable): Runs one agent turn for a task, given a prompt describing the events.
+            get_prices (Callable): Returns USD prices by token address at a block hash, or None to ignore prices.
+            get_mentions (Callable): Returns mentions not returned before (see MentionIngestor.poll),
+                or None to ignore mentions.
+            poll_interval (float): Seconds between block checks.
+            debounce (float): Quiet period after the last event before a tick runs.
+            max_delay (float): Longest a tick is held back by a stream of events.
+            min_interval (float): Minimum seconds between two ticks of the same task.
+            price_threshold (float): Relative price move that counts as an event (e.g. 0.01 for 1%).
+            mention_interval (float): Seconds between mention checks.
+            store (StateStore): Where task state and the last block are checkpointed, so a
+                restart resumes from them instead of acting on the same events again.
+        """
+        self.w3 = w3
+        self.tasks = tasks
+        self.run_tick = run_tick
+        self.get_prices = get_prices
+        self.get_mentions = get_mentions
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.min_interval = min_interval
+        self.price_threshold = price_threshold
+        self.mention_interval = mention_interval
+        self.store = store
+
+        self.executor = ThreadPoolExecutor(max_workers=max(len(tasks), 1))
+        self.last_block = None
+        self.last_mention_poll = 0.0
+
+        if store is not None:
+            self.chain_id = str(w3.eth.chain_id)
+            self.last_block = store.get_block(self.chain_id)
+            for task in tasks:
+                checkpoint = store.load_task(task.name)
+                if checkpoint:
+                    task.restore(checkpoint)
+
+    def emit(self, task: AgentTask, kind: str, now: float, **details):
+        metrics.inc("scheduler_events_total", {"kind": kind})
+        task.add_event({"kind": kind, **details}, now)
+
+    def poll_chain(self, now: float):
+        # Compared by hash, so a reorg (or an anvil evm_revert) to the same height still
+        # counts as a new block
+        latest = self.w3.eth.get_block("latest")
+        block_hash = Web3.to_hex(latest["hash"])
+        if block_hash == self.last_block:
+            return
+        self.last_block = block_hash
+        if self.store is not None:
+            self.store.set_block(self.chain_id, block_hash)
+        block = latest["number"]
+
+        prices = self.get_prices(block_hash) if self.get_prices else {}
+
+        for task in self.tasks:
+            # A running tick's own transactions and gas change its balances; those are
+            # taken as the new baseline when it finishes (see rebase_balances)
+            if not task.running:
+                balances = get_balances(self.w3, task.address, task.tokens, block_identifier=block_hash)
+                if task.balances and balances != task.balances:
+                    changed = {asset: balance for asset, balance in balances.items()
+                               if task.balances.get(asset) != balance}
+                    self.emit(task, "balance", now, block=block, changed=changed)
+                task.balances = balances
+
+            for token in task.tokens:
+                price = prices.get(token)
+                if not price:
+                    continue
+                reference = task.price_refs.get(token)
+                if reference is None:
+                    task.price_refs[token] = price
+                elif abs(price / reference - 1) >= self.price_threshold:
+                    self.emit(task, "price", now, token=token, price=price)
+                    task.price_refs[token] = price
+
+    def poll_mentions(self, now: float):
+        if not self.get_mentions or now - self.last_mention_poll < self.mention_interval:
+            return
+        self.last_mention_poll = now
+
+        for mention in self.get_mentions():
+            if "id" not in mention:
+                continue
+            for task in self.tasks:
+                task.mentions.append(mention)
+                self.emit(task, "mention", now, id=mention["id"],
+                          user=mention.get("user"), text=mention.get("text"))
+
+    def describe_events(self, task: AgentTask) -> str:
+        lines = [task.prompt, "", "Since your last action:"]
+        for event in task.pending:
+            if event["kind"] == "start":
+                lines.append("- You just started. Review your wallet and decide what to do.")
+            elif event["kind"] == "balance":
+                lines.append(f"- Balances changed at block {event['block']}: {event['changed']}")
+            elif event["kind"] == "price":
+                lines.append(f"- The price of {event['token']} moved to ${event['price']:.4f}")
+            elif event["kind"] == "mention":
+                lines.append(f"- @{event['user']} mentioned you (tweet {event['id']}): {event['text']}")
+        return "\n".join(lines)
+
+    def maybe_tick(self, task: AgentTask, now: float):
+        if not task.pending or task.running:
+            return
+        quiet = now - task.last_event_at >= self.debounce
+        overdue = now - task.first_event_at >= self.max_delay
+        if not (quiet or overdue) or now - task.last_tick_at < self.min_interval:
+            return
+
+        digest = task.digest()
+        if digest == task.last_digest:
+            # Events cancelled each other out (e.g. a price moved and came back)
+            metrics.inc("scheduler_ticks_total", {"task": task.name, "result": "skipped"})
+            task.pending = []
+            task.first_event_at = None
+            return
+
+        thought = self.describe_events(task)
+        task.pending = []
+        task.first_event_at = None
+        # The tick consumes the mentions, so the digest it leaves behind no longer includes them
+        task.mentions = []
+        task.last_digest = task.digest()
+        task.last_tick_at = now
+        task.running = True
+        metrics.inc("scheduler_ticks_total", {"task": task.name, "result": "run"})
+        self.save_task(task)
+
+        price_refs = dict(task.price_refs)
+
+        def run():
+            try:
+                self.run_tick(task, thought)
+            except Exception as e:
+                print(f"Error in {task.name} tick: {e}")
+            finally:
+                try:
+                    self.rebase_balances(task, price_refs)
+                except Exception as e:
+                    print(f"Error reading {task.name} balances: {e}")
+                task.running = False
+
+        self.executor.submit(run)
+
+    def rebase_balances(self, task: AgentTask, price_refs: dict):
+        """
+        Take the balances a tick left behind as the task's new baseline, so the agent
+        doesn't wake up again just because of its own transactions.
+        """
+        task.balances = get_balances(self.w3, task.address, task.tokens)
+        # Prices and mentions reported during the tick still count as new
+        task.last_digest = task.digest(price_refs, mentions=[])
+        self.save_task(task)
+
+    def save_task(self, task: AgentTask):
+        if self.store is not None:
+            self.store.save_task(task.name, task.checkpoint())
+
+    def run(self):
+        print(f"Watching {len(self.tasks)} agent(s) for on-chain and social events...")
+        for task in self.tasks:
+            self.emit(task, "start", time.monotonic())
+
+        while True:
+            now = time.monotonic()
+            try:
+                self.poll_chain(now)
+                self.poll_mentions(now)
+            except Exception as e:
+                print(f"Error polling events: {e}")
+
+            for task in self.tasks:
+                self.maybe_tick(task, now)
+
+            time.sleep(self.poll_interval)
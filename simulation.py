@@ -0,0 +1,276 @@
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from web3 import Web3
+from web3.exceptions import ContractLogicError
+from web3.middleware import Web3Middleware
+
+from metrics import simulating
+from multicall import block_hash, multicall
+
+# Standard Solidity revert payloads
+ERROR_SELECTOR = "08c379a0"  # Error(string)
+PANIC_SELECTOR = "4e487b71"  # Panic(uint256)
+
+PANIC_CODES = {
+    0x01: "assertion failed",
+    0x11: "arithmetic overflow or underflow",
+    0x12: "division by zero",
+    0x21: "invalid enum value",
+    0x31: "pop on empty array",
+    0x32: "array index out of bounds",
+    0x41: "out of memory",
+    0x51: "call to uninitialized function",
+}
+
+class NodeLock:
+    """
+    Reader-writer lock around the node. Ordinary requests share it. A snapshot window
+    (evm_snapshot ... evm_revert) holds it exclusively, so no other thread reads state
+    that is about to be reverted, or block numbers that will be reused afterwards.
+
+    The thread holding it exclusively keeps making requests as usual. It only covers
+    requests made through this process's Web3 instance with NodeLockMiddleware.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writers_waiting = 0
+        self.owner = None
+        self.depth = 0
+
+    @contextmanager
+    def shared(self):
+        with self.condition:
+            if self.owner == threading.get_ident():
+                owned = True
+            else:
+                owned = False
+                # Waiting writers go first, so a busy node can't starve a simulation
+                self.condition.wait_for(lambda: self.owner is None and not self.writers_waiting)
+                self.readers += 1
+        try:
+            yield
+        finally:
+            if not owned:
+                with self.condition:
+                    self.readers -= 1
+                    self.condition.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        me = threading.get_ident()
+        with self.condition:
+            if self.owner != me:
+                self.writers_waiting += 1
+                self.condition.wait_for(lambda: self.owner is None and not self.readers)
+                self.writers_waiting -= 1
+                self.owner = me
+            self.depth += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.depth -= 1
+                if not self.depth:
+                    self.owner = None
+                    self.condition.notify_all()
+
+
+node_lock = NodeLock()
+
+
+class NodeLockMiddleware(Web3Middleware):
+    """
+    Web3 middleware that holds node_lock (shared) for every request, so requests from
+    other threads wait while a snapshot window is open.
+    """
+
+    def wrap_make_request(self, make_request):
+        def middleware(method, params):
+            with node_lock.shared():
+                return make_request(method, params)
+
+        return middleware
+
+
+# (block hash, from, to, value, data) -> simulation result
+simulation_cache: Dict[tuple, dict] = {}
+simulation_cache_block: Optional[str] = None
+
+
+def decode_revert_reason(w3, data) -> str:
+    """
+    Decode the return data of a reverted call into a readable reason.
+
+    Args:
+        w3 (Web3): The Web3 instance whose codec to use.
+        data (str | bytes): Raw revert data.
+
+    Returns:
+        str: The revert reason, or the raw data if it is not a standard error.
+    """
+    if isinstance(data, (bytes, bytearray)):
+        data = data.hex()
+    data = (data or "").removeprefix("0x")
+
+    if not data:
+        return "reverted without a reason"
+    if data.startswith(ERROR_SELECTOR):
+        return w3.codec.decode(['string'], bytes.fromhex(data[8:]))[0]
+    if data.startswith(PANIC_SELECTOR):
+        code = w3.codec.decode(['uint256'], bytes.fromhex(data[8:]))[0]
+        return f"panic: {PANIC_CODES.get(code, hex(code))}"
+
+    return f"custom error 0x{data}"
+
+
+def revert_reason(w3, error: Exception) -> str:
+    """
+    Extract the revert reason from an exception raised by eth_call or eth_estimateGas.
+    """
+    data = getattr(error, "data", None)
+    if isinstance(data, str) and data.startswith("0x"):
+        return decode_revert_reason(w3, data)
+    return str(error)
+
+
+def simulate_transaction(w3, tx: dict, block_identifier=None) -> dict:
+    """
+    Dry-run a transaction with eth_call and eth_estimateGas without broadcasting it.
+
+    Results are cached per (block hash, calldata), so repeated checks of the same plan are free.
+
+    Args:
+        w3 (Web3): The Web3 instance to use.
+        tx (dict): Transaction with at least `from` and `to`, and optionally `value` and `data`.
+        block_identifier: Block number, tag or hash to simulate against. Defaults to the latest block.
+
+    Returns:
+        dict: `success`, `gas` estimate, `return_data` and the decoded `revert_reason`, if any.
+    """
+    global simulation_cache_block
+
+    if block_identifier is None:
+        block_identifier = "latest"
+    block_identifier = block_hash(w3, block_identifier)
+
+    if block_identifier != simulation_cache_block:
+        simulation_cache.clear()
+        simulation_cache_block = block_identifier
+
+    call = {
+        "from": Web3.to_checksum_address(tx["from"]),
+        "to": Web3.to_checksum_address(tx["to"]),
+        "value": tx.get("value", 0),
+        "data": tx.get("data", "0x"),
+    }
+    key = (block_identifier, call["from"], call["to"], call["value"], call["data"])
+    if key in simulation_cache:
+        return simulation_cache[key]
+
+    try:
+        return_data = w3.eth.call(call, block_identifier=block_identifier)
+        gas = w3.eth.estimate_gas(call, block_identifier=block_identifier)
+        result = {
+            "success": True,
+            "gas": gas,
+            "return_data": Web3.to_hex(return_data),
+            "revert_reason": None,
+        }
+    except ContractLogicError as e:
+        result = {
+            "success": False,
+            "gas": None,
+            "return_data": None,
+            "revert_reason": revert_reason(w3, e),
+        }
+
+    simulation_cache[key] = result
+    return result
+
+
+def clear_simulation_cache():
+    global simulation_cache_block
+
+    simulation_cache.clear()
+    simulation_cache_block = None
+
+
+def get_balances(w3, address: str, token_addresses: List[str], block_identifier="latest") -> dict:
+    """
+    Read the native balance and a set of ERC-20 balances of an address in one round of calls.
+    """
+    owner = Web3.to_checksum_address(address)
+    # balanceOf(address)
+    data = Web3.to_bytes(hexstr="0x70a08231") + w3.codec.encode(['address'], [owner])
+    results = multicall(w3, [(Web3.to_checksum_address(token), data) for token in token_addresses],
+                        block_identifier=block_identifier)
+
+    balances = {"ETH": w3.eth.get_balance(owner, block_identifier=block_identifier)}
+    for token, result in zip(token_addresses, results):
+        balances[token] = w3.codec.decode(['uint256'], result)[0] if result else 0
+    return balances
+
+
+def simulate_plan(w3, txs: List[dict], address: str, token_addresses: List[str] = None) -> dict:
+    """
+    Execute a multi-step plan on an anvil fork and roll it back with evm_snapshot/evm_revert.
+
+    Each step sees the state left by the previous one (e.g. an approve followed by a swap),
+    which a plain eth_call cannot do. Nothing is left on chain afterwards. The snapshot is
+    global to the node, so node_lock is held exclusively until the revert.
+
+    Args:
+        w3 (Web3): A Web3 instance connected to anvil (see run_fork.sh).
+        txs (list): Transactions to execute in order, sent unsigned from unlocked accounts.
+        address (str): Address whose balance changes should be reported.
+        token_addresses (list): ERC-20 tokens to include in the balance changes.
+
+    Returns:
+        dict: Per-step status, gas used and revert reason, plus the net balance deltas.
+    """
+    token_addresses = token_addresses or []
+
+    with node_lock.exclusive():
+        return run_plan(w3, txs, address, token_addresses)
+
+
+def run_plan(w3, txs: List[dict], address: str, token_addresses: List[str]) -> dict:
+    snapshot_id = w3.provider.make_request("evm_snapshot", [])["result"]
+    token = simulating.set(True)
+    try:
+        before = get_balances(w3, address, token_addresses)
+
+        steps = []
+        for tx in txs:
+            # Stop at the first failure, later steps would only fail for the same reason
+            check = simulate_transaction(w3, tx)
+            if not check["success"]:
+                steps.append({"success": False, "gas_used": None,
+                              "revert_reason": check["revert_reason"]})
+                break
+
+            tx_hash = w3.eth.send_transaction({**tx, "gas": check["gas"]})
+            receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+            steps.append({"success": receipt.status == 1, "gas_used": receipt.gasUsed,
+                          "revert_reason": None if receipt.status == 1 else "reverted"})
+            if receipt.status != 1:
+                break
+
+        after = get_balances(w3, address, token_addresses)
+    finally:
+        simulating.reset(token)
+        w3.provider.make_request("evm_revert", [snapshot_id])
+        # Block numbers are reused after the revert, so cached results would be stale
+        clear_simulation_cache()
+
+    return {
+        "success": len(steps) == len(txs) and all(step["success"] for step in steps),
+        "steps": steps,
+        "gas_used": sum(step["gas_used"] or 0 for step in steps),
+        "balance_deltas": {asset: after[asset] - before[asset]
+                           for asset in before if after[asset] != before[asset]},
+    }
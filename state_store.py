@@ -0,0 +1,294 @@
+import os
+import json
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+from web3.middleware import Web3Middleware
+
+from metrics import current_tool, current_trace, simulating
+
+STATE_PATH = os.getenv("AGENT_STATE_DB", "agent_state.db")
+
+# Journal entries between automatic compactions
+COMPACT_EVERY = 1000
+
+# Messages kept per session when compacting
+MAX_HISTORY = 100
+
+
+def trim_history(messages: List[dict], limit: int) -> List[dict]:
+    """
+    Keep the last `limit` messages, starting at a user message so no tool
+    result is left without the assistant message that called it.
+    """
+    if len(messages) <= limit:
+        return messages
+    trimmed = messages[-limit:]
+    for i, message in enumerate(trimmed):
+        if message.get("role") == "user":
+            return trimmed[i:]
+    return []
+
+
+class StateStore:
+    """
+    Agent state that survives restarts: conversation sessions, pending transactions,
+    the last block seen per chain, and autonomous task state.
+
+    Every change is appended to a write-ahead journal in SQLite (WAL mode) and applied
+    to an in-memory copy. Periodically the in-memory state is written out as a compact
+    snapshot and the journal is truncated, so startup only loads the snapshot and replays
+    a short journal tail.
+
+    Several processes may share one database (e.g. uvicorn workers and run.py). Each
+    write catches up on the entries other processes appended, inside the same SQLite
+    write transaction, and compaction only removes entries already in its snapshot.
+    """
+
+    def __init__(self, path: str = STATE_PATH, compact_every: int = COMPACT_EVERY,
+                 max_history: int = MAX_HISTORY):
+        self.path = path
+        self.compact_every = compact_every
+        self.max_history = max_history
+        self.lock = threading.RLock()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS journal ("
+                          "seq INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT, key TEXT, payload TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS snapshot ("
+                          "kind TEXT, key TEXT, payload TEXT, PRIMARY KEY (kind, key))")
+
+        # Highest journal seq applied to self.state
+        self.last_seq = 0
+        self.state = self.load()
+
+    @staticmethod
+    def apply(state: dict, kind: str, key: str, payload):
+        """Apply one journal entry to the in-memory state"""
+        if kind == "session":
+            state["sessions"][key] = payload
+        elif kind == "message":
+            state["sessions"].setdefault(key, []).append(payload)
+        elif kind == "tx_pending":
+            state["pending_txs"][key] = payload
+        elif kind == "tx_done":
+            state["pending_txs"].pop(key, None)
+        elif kind == "block":
+            state["blocks"][key] = payload
+        elif kind == "task":
+            state["tasks"][key] = payload
+
+    def read_state(self) -> dict:
+        """Read the snapshot and the journal written since it. Call inside a transaction"""
+        state = {"sessions": {}, "pending_txs": {}, "blocks": {}, "tasks": {}}
+        compacted_through = 0
+        for kind, key, payload in self.conn.execute("SELECT kind, key, payload FROM snapshot"):
+            if kind == "meta" and key == "compacted_through":
+                compacted_through = json.loads(payload)
+            self.apply(state, kind, key, json.loads(payload))
+        rows = self.conn.execute("SELECT seq, kind, key, payload FROM journal ORDER BY seq").fetchall()
+        for _, kind, key, payload in rows:
+            self.apply(state, kind, key, json.loads(payload))
+        self.last_seq = max([compacted_through] + [row[0] for row in rows])
+        self.journal_size = len(rows)
+        return state
+
+    def load(self) -> dict:
+        """Load the snapshot and replay the journal written since it"""
+        with self.lock:
+            # One read transaction, so a compaction in another process can't land in between
+            self.conn.execute("BEGIN")
+            try:
+                return self.read_state()
+            finally:
+                self.conn.execute("COMMIT")
+
+    def catch_up(self):
+        """
+        Apply the journal entries written since the last one applied, by this or another
+        process. Call inside a transaction. If another process has compacted entries this
+        one never applied, the whole state is read again instead.
+        """
+        row = self.conn.execute("SELECT payload FROM snapshot "
+                                "WHERE kind = 'meta' AND key = 'compacted_through'").fetchone()
+        if row and json.loads(row[0]) > self.last_seq:
+            self.state = self.read_state()
+            return
+
+        rows = self.conn.execute("SELECT seq, kind, key, payload FROM journal WHERE seq > ? ORDER BY seq",
+                                 (self.last_seq,)).fetchall()
+        for seq, kind, key, payload in rows:
+            self.apply(self.state, kind, key, json.loads(payload))
+            self.last_seq = seq
+        self.journal_size += len(rows)
+
+    def refresh(self):
+        """Pick up changes other processes made since this one last read or wrote"""
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.catch_up()
+            finally:
+                self.conn.execute("COMMIT")
+
+    def append(self, kind: str, key: str, payload=None):
+        """Durably record a change, then apply it"""
+        data = json.dumps(payload, default=str)
+        with self.lock:
+            # IMMEDIATE takes the database write lock, so no other process can append
+            # between our insert and catching up to it. Our own entry is applied as read
+            # back from the database, so memory matches what a restart would load
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("INSERT INTO journal (kind, key, payload) VALUES (?, ?, ?)",
+                                  (kind, key, data))
+                self.catch_up()
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            if self.journal_size >= self.compact_every:
+                self.compact()
+
+    def compact(self):
+        """
+        Replace the snapshot with the current state and truncate the journal.
+
+        The state is caught up under the write lock first and only entries it includes are
+        deleted, so changes made by other processes are kept.
+        """
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.catch_up()
+                rows = [("session", session_id, json.dumps(trim_history(messages, self.max_history)))
+                        for session_id, messages in self.state["sessions"].items()]
+                rows += [("tx_pending", tx_hash, json.dumps(info))
+                         for tx_hash, info in self.state["pending_txs"].items()]
+                rows += [("block", chain_id, json.dumps(block))
+                         for chain_id, block in self.state["blocks"].items()]
+                rows += [("task", name, json.dumps(task))
+                         for name, task in self.state["tasks"].items()]
+                rows.append(("meta", "compacted_through", json.dumps(self.last_seq)))
+
+                self.conn.execute("DELETE FROM snapshot")
+                self.conn.executemany(
+                    "INSERT INTO snapshot (kind, key, payload) VALUES (?, ?, ?)", rows)
+                self.conn.execute("DELETE FROM journal WHERE seq <= ?", (self.last_seq,))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+            for session_id, messages in self.state["sessions"].items():
+                self.state["sessions"][session_id] = trim_history(messages, self.max_history)
+            self.journal_size = 0
+
+    def session(self, session_id: str) -> List[dict]:
+        """Conversation history of a session. Add to it with add_messages"""
+        with self.lock:
+            self.refresh()
+            return self.state["sessions"].setdefault(session_id, [])
+
+    def add_messages(self, session_id: str, messages: List[dict]):
+        for message in messages:
+            self.append("message", session_id, message)
+
+    def track_transaction(self, tx_hash: str, info: dict):
+        self.append("tx_pending", tx_hash, info)
+
+    def clear_transaction(self, tx_hash: str):
+        """Stop tracking a transaction, once mined or known to be gone"""
+        if tx_hash in self.state["pending_txs"]:
+            self.append("tx_done", tx_hash)
+
+    def pending_transactions(self) -> Dict[str, dict]:
+        with self.lock:
+            self.refresh()
+            return dict(self.state["pending_txs"])
+
+    def set_block(self, chain_id: str, block: str):
+        if self.state["blocks"].get(chain_id) != block:
+            self.append("block", chain_id, block)
+
+    def get_block(self, chain_id: str) -> Optional[str]:
+        return self.state["blocks"].get(chain_id)
+
+    def save_task(self, name: str, task_state: dict):
+        self.append("task", name, task_state)
+
+    def load_task(self, name: str) -> Optional[dict]:
+        return self.state["tasks"].get(name)
+
+
+store: Optional[StateStore] = None
+store_lock = threading.Lock()
+
+
+def get_store() -> StateStore:
+    """
+    The process-wide state store, opened on first use rather than when the module is imported.
+    """
+    global store
+    with store_lock:
+        if store is None:
+            store = StateStore()
+        return store
+
+
+def normalize_hash(tx_hash) -> str:
+    return (tx_hash if isinstance(tx_hash, str) else Web3.to_hex(tx_hash)).lower()
+
+
+class TransactionJournalMiddleware(Web3Middleware):
+    """
+    Web3 middleware that journals every transaction hash the node accepts and clears it
+    once the node reports it mined or unknown, so in-flight transactions survive a restart.
+    Transactions sent while simulating are rolled back by evm_revert, so they are not journaled.
+    """
+
+    def wrap_make_request(self, make_request):
+        def middleware(method, params):
+            response = make_request(method, params)
+            if simulating.get():
+                return response
+
+            if method in ("eth_sendTransaction", "eth_sendRawTransaction") and "result" in response:
+                trace = current_trace.get()
+                get_store().track_transaction(response["result"].lower(), {
+                    "tool": current_tool.get(),
+                    "session_id": trace["session_id"] if trace else None,
+                })
+            elif method == "eth_getTransactionReceipt" and response.get("result"):
+                get_store().clear_transaction(normalize_hash(params[0]))
+            elif method == "eth_getTransactionByHash" and "result" in response:
+                # Null means the node has no such transaction: dropped, or erased by a fork restart
+                result = response["result"]
+                if result is None or result.get("blockNumber") is not None:
+                    get_store().clear_transaction(normalize_hash(params[0]))
+
+            return response
+
+        return middleware
+
+
+def check_pending_transactions(w3) -> Dict[str, dict]:
+    """
+    Re-check every transaction still marked pending. Mined ones are cleared, and so are ones
+    the node no longer knows (dropped, or erased when the fork restarted). The rest are
+    returned, so they are waited on rather than sent again.
+    """
+    store = get_store()
+    for tx_hash in list(store.pending_transactions()):
+        try:
+            tx = w3.eth.get_transaction(tx_hash)
+        except TransactionNotFound:
+            tx = None
+        if tx is None or tx["blockNumber"] is not None:
+            store.clear_transaction(tx_hash)
+    return store.pending_transactions()
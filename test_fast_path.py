@@ -0,0 +1,101 @@
+import os
+
+# agents loads the wallet at import, so use anvil's first dev key. Keep any state
+# store out of the working directory
+os.environ.setdefault("PRIVATE_KEY", "0xac0974bec39a17e36ba4a6b4d238ff944bacb478cbed5efcae784d7bf4f2ff80")
+os.environ.setdefault("AGENT_STATE_DB", ":memory:")
+
+from types import SimpleNamespace  # noqa: E402
+
+import pytest  # noqa: E402
+
+import fast_path  # noqa: E402
+
+# Table-driven tests for the fast-path grammar, with every tool call stubbed so no
+# node is needed. Run with `pytest test_fast_path.py`.
+
+WALLET = "0x70997970C51812dc3A010C7d01b50e0d17dc79C8"
+OTHER = "0x3c44cdddb6a900fa2b585dd299e03d12fa4293bc"
+
+USDC = {
+    "1": "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48",
+    "8453": "0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913",
+}
+AAVE_POOL = {
+    "1": "0x87870Bca3F3fD6335C3F4ce8392D69350B4fA4E2",
+    "42161": "0x794a61358D6845594F94dc1DB02A252b5b4814aD",
+}
+UNISWAP_FACTORY = "0x1F98431c8aD98523631AE4a59f267346ea31F984"
+
+
+@pytest.fixture(autouse=True)
+def tools(monkeypatch):
+    tokens = {chain_id: {address: {"symbol": "USDC", "name": "USD Coin", "decimals": 6}}
+              for chain_id, address in USDC.items()}
+    contexts = {chain_id: {"addresses": {"aave": {"pool": pool},
+                                         "uniswap": {"factory": UNISWAP_FACTORY}}}
+                for chain_id, pool in AAVE_POOL.items()}
+
+    monkeypatch.setattr(fast_path, "wallet", SimpleNamespace(address=WALLET))
+    monkeypatch.setattr(fast_path, "tokens", tokens)
+    monkeypatch.setattr(fast_path, "get_eth_balance", lambda address: "1.5")
+    monkeypatch.setattr(fast_path, "get_token_data",
+                        lambda chain_id, address: {**tokens[chain_id][address], "address": address})
+    # The real tool raises KeyError for chains it doesn't know
+    monkeypatch.setattr(fast_path, "get_crypto_context", lambda chain_id: contexts[chain_id])
+
+
+HITS = [
+    ("What's my balance?", f"{WALLET} has 1.5 ETH."),
+    ("what is my ETH balance", f"{WALLET} has 1.5 ETH."),
+    ("How much ETH do I have?", f"{WALLET} has 1.5 ETH."),
+    (f"balance of {OTHER}", f"{OTHER} has 1.5 ETH."),
+    (f"How much ETH does {OTHER} have?", f"{OTHER} has 1.5 ETH."),
+    ("address of USDC", f"USDC (USD Coin) on chain 1 is at {USDC['1']}, with 6 decimals."),
+    ("Address of USDC on Base", f"USDC (USD Coin) on chain 8453 is at {USDC['8453']}, with 6 decimals."),
+    ("What's the USDC contract address on base?",
+     f"USDC (USD Coin) on chain 8453 is at {USDC['8453']}, with 6 decimals."),
+    ("usdc address on chain 8453", f"USDC (USD Coin) on chain 8453 is at {USDC['8453']}, with 6 decimals."),
+    ("What’s the Aave pool on Arbitrum?", f"The Aave pool on chain 42161 is {AAVE_POOL['42161']}."),
+    ("aave lending pool address on chain 42161", f"The Aave pool on chain 42161 is {AAVE_POOL['42161']}."),
+    ("Show me the Aave V3 pool on chain id 42161", f"The Aave pool on chain 42161 is {AAVE_POOL['42161']}."),
+    ("uniswap factory on ethereum mainnet", f"The Uniswap factory on chain 1 is {UNISWAP_FACTORY}."),
+]
+
+MISSES = [
+    "What's my address?",
+    "balance",
+    "Swap 1 WETH for USDC",
+    "address of USDC on Polygon",
+    "address of USDC on Narnia",
+    "address of DOGE",
+    "What's the Aave pool on Optimism?",
+    "uniswap position manager",
+    "What's my balance and the USDC address?",
+]
+
+
+@pytest.mark.parametrize("message,expected", HITS, ids=[hit[0] for hit in HITS])
+def test_hits(message, expected):
+    assert fast_path.answer(message) == expected
+
+
+@pytest.mark.parametrize("message", MISSES)
+def test_misses(message):
+    assert fast_path.answer(message) is None
+
+
+@pytest.mark.parametrize("name,chain_id", [
+    (None, "1"),
+    ("base", "8453"),
+    ("chain 42161", "42161"),
+    ("chain id 42161", "42161"),
+    ("42161", "42161"),
+    ("the arbitrum network", "42161"),
+    ("ethereum mainnet", "1"),
+    ("bnb chain", "56"),
+    ("chain 999", None),
+    ("narnia", None),
+])
+def test_parse_chain(name, chain_id):
+    assert fast_path.parse_chain(name) == chain_id
@@ -0,0 +1,111 @@
+import math
+from types import SimpleNamespace
+
+import pytest
+
+from price_oracle import PriceOracle
+
+# Tests for the pool-state-to-USD maths in PriceOracle.compute_prices, fed with
+# hand-built pool states so no node is needed. Run with `pytest test_price_oracle.py`.
+
+# Ordered by address, which decides token0/token1 in a pool: TKN < USDC < WETH < BIG
+TKN = "0x1111111111111111111111111111111111111111"
+USDC = "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48"
+WETH = "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
+BIG = "0xFFfFfFffFFfffFFfFFfFFFFFffFFFffffFfFFFfF"
+
+TOKENS = {
+    TKN: {"symbol": "TKN", "decimals": 18},
+    USDC: {"symbol": "USDC", "decimals": 6},
+    WETH: {"symbol": "WETH", "decimals": 18},
+    BIG: {"symbol": "BIG", "decimals": 8},
+}
+
+
+class FakeContract:
+    def __init__(self, address, abi):
+        self.address = address
+
+    def encode_abi(self, *args, **kwargs):
+        return "0x00"
+
+
+@pytest.fixture
+def oracle():
+    w3 = SimpleNamespace(eth=SimpleNamespace(contract=FakeContract))
+    return PriceOracle(w3, TOKENS, "0x0000000000000000000000000000000000000000", wrapped_native=WETH)
+
+
+def pool_state(token, quote, price, liquidity=10 ** 18, twap=False):
+    """Pool state pricing one whole `token` at `price` whole `quote`, as read_pools returns it"""
+    token_is_0 = int(token, 16) < int(quote, 16)
+    token0, token1 = (token, quote) if token_is_0 else (quote, token)
+    price_1_per_0 = price if token_is_0 else 1 / price
+    raw_price = price_1_per_0 * 10 ** (TOKENS[token1]["decimals"] - TOKENS[token0]["decimals"])
+    sqrt_price_x96 = int(math.sqrt(raw_price) * 2 ** 96)
+    tick = math.log(raw_price) / math.log(1.0001) if twap else None
+    return (token, quote, sqrt_price_x96, liquidity, tick)
+
+
+def test_no_pools(oracle):
+    assert oracle.compute_prices([], 0) == {}
+
+
+def test_token1_priced_in_usdc(oracle):
+    # USDC sorts before WETH, so WETH is token1 of its USDC pool
+    prices = oracle.compute_prices([pool_state(WETH, USDC, 3000.0)], 0)
+    assert prices[USDC] == 1.0
+    assert prices[WETH] == pytest.approx(3000.0)
+
+
+def test_token0_priced_through_weth(oracle):
+    # TKN sorts before WETH (token0), and is priced in WETH, which is priced in USDC
+    prices = oracle.compute_prices([
+        pool_state(TKN, WETH, 0.001),
+        pool_state(WETH, USDC, 3000.0),
+    ], 0)
+    assert prices[TKN] == pytest.approx(3.0)
+    assert prices[WETH] == pytest.approx(3000.0)
+
+
+def test_decimals_of_both_sides(oracle):
+    # BIG has 8 decimals and sorts after WETH, so it is token1 against an 18-decimal token0
+    prices = oracle.compute_prices([
+        pool_state(BIG, WETH, 20.0),
+        pool_state(WETH, USDC, 2500.0),
+    ], 0)
+    assert prices[BIG] == pytest.approx(50000.0)
+
+
+def test_deepest_pool_wins(oracle):
+    prices = oracle.compute_prices([
+        pool_state(TKN, USDC, 2.0, liquidity=10 ** 15),
+        pool_state(TKN, USDC, 3.0, liquidity=10 ** 20),
+        pool_state(TKN, USDC, 4.0, liquidity=10 ** 16),
+    ], 0)
+    assert prices[TKN] == pytest.approx(3.0)
+
+
+def test_deepest_pool_across_quotes(oracle):
+    # The shallow USDC pool loses to the deep WETH pool, whose price is then chained through WETH
+    prices = oracle.compute_prices([
+        pool_state(TKN, USDC, 9.0, liquidity=10 ** 12),
+        pool_state(TKN, WETH, 0.001, liquidity=10 ** 22),
+        pool_state(WETH, USDC, 3000.0),
+    ], 0)
+    assert prices[TKN] == pytest.approx(3.0)
+
+
+def test_unpriceable_tokens_are_omitted(oracle):
+    # WETH has no USDC pool, so neither it nor TKN can be priced in USD
+    prices = oracle.compute_prices([pool_state(TKN, WETH, 0.001)], 0)
+    assert prices == {USDC: 1.0}
+
+
+def test_twap_uses_the_tick(oracle):
+    # A spot sqrtPrice far from the TWAP tick must be ignored when a window is given
+    spot = pool_state(WETH, USDC, 1000.0)
+    twap = pool_state(WETH, USDC, 3000.0, twap=True)
+    state = (WETH, USDC, spot[2], spot[3], twap[4])
+    prices = oracle.compute_prices([state], 300)
+    assert prices[WETH] == pytest.approx(3000.0)
@@ -0,0 +1,59 @@
+import threading
+import time
+
+from simulation import NodeLock
+
+# Tests for the node lock that keeps other threads off the node during a snapshot
+# window. Run with `pytest test_simulation.py`.
+
+
+def test_readers_wait_for_the_snapshot_window():
+    lock = NodeLock()
+    events = []
+    entered = threading.Event()
+
+    def simulation():
+        with lock.exclusive():
+            entered.set()
+            # The owner keeps making requests, and may nest windows
+            with lock.shared(), lock.exclusive():
+                time.sleep(0.1)
+            events.append("reverted")
+
+    def reader():
+        entered.wait()
+        with lock.shared():
+            events.append("read")
+
+    threads = [threading.Thread(target=simulation), threading.Thread(target=reader)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert events == ["reverted", "read"]
+
+
+def test_snapshot_window_waits_for_readers():
+    lock = NodeLock()
+    events = []
+    reading = threading.Event()
+
+    def reader():
+        with lock.shared():
+            reading.set()
+            time.sleep(0.1)
+            events.append("read")
+
+    def simulation():
+        reading.wait()
+        with lock.exclusive():
+            events.append("snapshot")
+
+    threads = [threading.Thread(target=reader), threading.Thread(target=simulation)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert events == ["read", "snapshot"]
@@ -0,0 +1,150 @@
+import os
+import subprocess
+import sys
+
+# Keep the process-wide store out of the working directory
+os.environ.setdefault("AGENT_STATE_DB", ":memory:")
+
+from types import SimpleNamespace  # noqa: E402
+
+from web3.exceptions import TransactionNotFound  # noqa: E402
+
+import state_store  # noqa: E402
+from state_store import StateStore, trim_history, check_pending_transactions  # noqa: E402
+
+# Tests for the state journal: replay, compaction and history trimming.
+# Run with `pytest test_state_store.py`.
+
+
+def user(text):
+    return {"role": "user", "content": text}
+
+
+def assistant(text, tool_calls=None):
+    return {"role": "assistant", "content": text, "tool_calls": tool_calls}
+
+
+def tool(text):
+    return {"role": "tool", "content": text}
+
+
+def test_trim_history_keeps_short_histories():
+    messages = [user("a"), assistant("b")]
+    assert trim_history(messages, 2) == messages
+    assert trim_history(messages, 5) == messages
+    assert trim_history([], 0) == []
+
+
+def test_trim_history_starts_at_a_user_message():
+    messages = [user("1"), assistant("", tool_calls=[{}]), tool("r"), assistant("2"),
+                user("3"), assistant("4")]
+    # The last 4 messages start with a tool result, whose call would be cut off
+    assert trim_history(messages, 4) == [user("3"), assistant("4")]
+    assert trim_history(messages, 2) == [user("3"), assistant("4")]
+    assert trim_history(messages, 6) == messages
+
+
+def test_trim_history_without_user_message_in_window():
+    messages = [user("1"), assistant("", tool_calls=[{}]), tool("r"), assistant("2")]
+    assert trim_history(messages, 3) == []
+
+
+def test_journal_replays_after_restart(tmp_path):
+    path = str(tmp_path / "state.db")
+    store = StateStore(path)
+    store.add_messages("s", [user("hi"), assistant("hello")])
+    store.track_transaction("0xaa", {"tool": "send_eth", "session_id": "s"})
+    store.track_transaction("0xbb", {"tool": "swap_tokens", "session_id": "s"})
+    store.clear_transaction("0xaa")
+    store.set_block("1", 100)
+    store.save_task("based", {"last_digest": "abc"})
+
+    restarted = StateStore(path)
+    assert restarted.session("s") == [user("hi"), assistant("hello")]
+    assert restarted.pending_transactions() == {"0xbb": {"tool": "swap_tokens", "session_id": "s"}}
+    assert restarted.get_block("1") == 100
+    assert restarted.load_task("based") == {"last_digest": "abc"}
+    assert restarted.journal_size == 7
+
+
+def test_replay_after_compaction(tmp_path):
+    path = str(tmp_path / "state.db")
+    store = StateStore(path, compact_every=5, max_history=4)
+    for i in range(6):
+        store.add_messages("s", [user(str(i)), assistant(str(i))])
+    store.track_transaction("0xaa", {"tool": "send_eth", "session_id": "s"})
+    store.set_block("1", 100)
+
+    restarted = StateStore(path, compact_every=5, max_history=4)
+    # Loaded from the snapshot plus the short journal tail written since the last compaction
+    assert restarted.journal_size < 5
+    assert restarted.session("s") == store.session("s")
+    assert restarted.session("s")[:4] == [user("3"), assistant("3"), user("4"), assistant("4")]
+    assert restarted.session("s")[-2:] == [user("5"), assistant("5")]
+    assert restarted.pending_transactions() == {"0xaa": {"tool": "send_eth", "session_id": "s"}}
+    assert restarted.get_block("1") == 100
+
+
+def test_cleared_transaction_stays_cleared_after_compaction(tmp_path):
+    path = str(tmp_path / "state.db")
+    store = StateStore(path)
+    store.track_transaction("0xaa", {"tool": "send_eth", "session_id": None})
+    store.compact()
+    store.clear_transaction("0xaa")
+    store.compact()
+
+    assert StateStore(path).pending_transactions() == {}
+
+
+def test_check_pending_transactions_clears_mined_and_unknown():
+    transactions = {"0xmined": {"blockNumber": 5}, "0xwaiting": {"blockNumber": None}}
+
+    def get_transaction(tx_hash):
+        if tx_hash not in transactions:
+            raise TransactionNotFound(tx_hash)
+        return transactions[tx_hash]
+
+    w3 = SimpleNamespace(eth=SimpleNamespace(get_transaction=get_transaction))
+    for tx_hash in ("0xmined", "0xwaiting", "0xdropped"):
+        state_store.get_store().track_transaction(tx_hash, {"tool": "send_eth", "session_id": None})
+
+    assert list(check_pending_transactions(w3)) == ["0xwaiting"]
+    state_store.get_store().clear_transaction("0xwaiting")
+
+
+def test_processes_sharing_a_database(tmp_path):
+    path = str(tmp_path / "state.db")
+    api = StateStore(path, compact_every=4)
+    runner = StateStore(path, compact_every=4)
+
+    api.add_messages("s", [user("hi")])
+    runner.save_task("based", {"last_digest": "abc"})
+    # Each write catches up on the other process's entries
+    api.add_messages("s", [assistant("hello")])
+    assert api.load_task("based") == {"last_digest": "abc"}
+    assert runner.session("s") == [user("hi"), assistant("hello")]
+
+    # Compacting in one process keeps what the other wrote, and the other picks it up
+    api.compact()
+    runner.track_transaction("0xaa", {"tool": "send_eth", "session_id": None})
+    api.add_messages("s", [user("bye")])
+    runner.compact()
+    api.set_block("1", "0xabc")
+
+    restarted = StateStore(path)
+    assert restarted.session("s") == [user("hi"), assistant("hello"), user("bye")]
+    assert restarted.pending_transactions() == {"0xaa": {"tool": "send_eth", "session_id": None}}
+    assert restarted.load_task("based") == {"last_digest": "abc"}
+    assert restarted.get_block("1") == "0xabc"
+    assert api.session("s") == runner.session("s") == restarted.session("s")
+
+
+def test_store_is_opened_lazily(tmp_path):
+    path = tmp_path / "state.db"
+    env = {**os.environ, "AGENT_STATE_DB": str(path)}
+    subprocess.run([sys.executable, "-c", "import state_store"], env=env, check=True)
+    assert not path.exists()
+
+    subprocess.run([sys.executable, "-c", "import state_store; state_store.get_store()"],
+                   env=env, check=True)
+    assert path.exists()
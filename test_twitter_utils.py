@@ -0,0 +1,147 @@
+import time
+from types import SimpleNamespace
+
+from twitter_utils import RateLimiter, TwitterBot, MentionIngestor
+
+# Tests for mention ingestion against a local fake of the tweepy API, so they run
+# offline and without credentials. Run with `pytest test_twitter_utils.py`.
+
+
+class FakeTwitterAPI:
+    """The subset of tweepy.API that TwitterBot uses, backed by in-memory mentions"""
+
+    def __init__(self, mentions=(), remaining=None, reset_in=900):
+        # Newest first, like the real timeline
+        self.mentions = sorted(mentions, key=lambda mention: mention.id, reverse=True)
+        self.remaining = remaining
+        self.reset_in = reset_in
+        self.calls = []
+        self.replies = []
+        self.last_response = None
+
+    def respond(self, endpoint):
+        self.calls.append(endpoint)
+        headers = {}
+        if self.remaining is not None:
+            headers = {'x-rate-limit-remaining': str(self.remaining), 'x-rate-limit-limit': '75',
+                       'x-rate-limit-reset': str(int(time.time()) + self.reset_in)}
+        self.last_response = SimpleNamespace(headers=headers)
+
+    def mentions_timeline(self, count, since_id=None, max_id=None, trim_user=False):
+        self.respond('mentions_timeline')
+        return [mention for mention in self.mentions
+                if (since_id is None or mention.id > since_id)
+                and (max_id is None or mention.id <= max_id)][:count]
+
+    def lookup_users(self, user_id):
+        self.respond('lookup_users')
+        return [SimpleNamespace(id=i, screen_name=f"user{i}") for i in user_id]
+
+    def update_status(self, status, in_reply_to_status_id=None, auto_populate_reply_metadata=False):
+        self.respond('update_status')
+        self.replies.append((in_reply_to_status_id, status))
+        return SimpleNamespace(id=len(self.replies))
+
+
+def mention(tweet_id, user_id=1):
+    return SimpleNamespace(id=tweet_id, text=f"hello {tweet_id}", user=SimpleNamespace(id=user_id),
+                           created_at=None)
+
+
+def make_bot(api):
+    return TwitterBot(None, None, None, None, api=api)
+
+
+def test_poll_returns_only_new_mentions(tmp_path):
+    api = FakeTwitterAPI([mention(i) for i in range(1, 4)])
+    ingestor = MentionIngestor(make_bot(api), state_path=str(tmp_path / "state.json"))
+
+    assert [m['id'] for m in ingestor.poll()] == [1, 2, 3]
+    assert ingestor.poll() == []
+
+    api.mentions = [mention(4)] + api.mentions
+    assert [m['id'] for m in ingestor.poll()] == [4]
+
+
+def test_poll_pages_back_to_since_id(tmp_path):
+    api = FakeTwitterAPI([mention(1)])
+    ingestor = MentionIngestor(make_bot(api), state_path=str(tmp_path / "state.json"), page_size=3)
+    ingestor.poll()
+
+    # More mentions than one page arrived since the last poll
+    api.mentions = [mention(i) for i in range(10, 1, -1)] + api.mentions
+    assert [m['id'] for m in ingestor.poll()] == list(range(2, 11))
+    assert ingestor.since_id == 10
+
+
+def test_since_id_survives_restart(tmp_path):
+    state_path = str(tmp_path / "state.json")
+    api = FakeTwitterAPI([mention(1), mention(2)])
+    MentionIngestor(make_bot(api), state_path=state_path).poll()
+
+    restarted = MentionIngestor(make_bot(api), state_path=state_path)
+    assert restarted.since_id == 2
+    assert restarted.poll() == []
+
+
+def test_author_lookups_are_batched_and_cached(tmp_path):
+    api = FakeTwitterAPI([mention(i, user_id=i % 2) for i in range(1, 6)])
+    bot = make_bot(api)
+    mentions = MentionIngestor(bot, state_path=str(tmp_path / "state.json")).poll()
+
+    assert {m['user'] for m in mentions} == {"user0", "user1"}
+    assert api.calls.count('lookup_users') == 1
+
+
+def test_replies_are_sent_once(tmp_path):
+    state_path = str(tmp_path / "state.json")
+    api = FakeTwitterAPI([mention(1)])
+    ingestor = MentionIngestor(make_bot(api), state_path=state_path)
+
+    assert ingestor.queue_reply(1, "hi").startswith("Queued")
+    assert ingestor.queue_reply(1, "hi again").startswith("Already")
+    ingestor.replies.join()
+    assert api.replies == [(1, "hi")]
+
+    restarted = MentionIngestor(make_bot(api), state_path=state_path)
+    assert restarted.queue_reply(1, "hi").startswith("Already")
+
+
+def test_replied_ids_are_bounded(tmp_path):
+    ingestor = MentionIngestor(make_bot(FakeTwitterAPI()), state_path=str(tmp_path / "state.json"),
+                               max_replied=3)
+    ingestor.replied = {1, 2, 3, 4, 5}
+    ingestor.save()
+    assert ingestor.replied == {3, 4, 5}
+
+
+def test_rate_limiter_waits_for_budget():
+    limiter = RateLimiter({'endpoint': (2, 0.2)})
+    start = time.monotonic()
+    for _ in range(3):
+        limiter.acquire('endpoint')
+    # Two requests fit in the bucket, the third waits for a refill (0.1s per request)
+    assert time.monotonic() - start >= 0.09
+
+
+def test_rate_limiter_follows_response_headers():
+    api = FakeTwitterAPI([mention(1)], remaining=5)
+    bot = make_bot(api)
+    bot.read_mentions()
+
+    tokens, capacity, _, _, _ = bot.rate_limiter.buckets['mentions_timeline']
+    assert int(tokens) == 5
+    assert capacity == 75
+
+    # An exhausted window blocks until the reported reset (at least 1s away), then the
+    # full limit is available again
+    api.remaining = 0
+    api.reset_in = 0
+    bot.read_mentions()
+    start = time.monotonic()
+    bot.rate_limiter.acquire('mentions_timeline')
+    assert time.monotonic() - start >= 0.9
+
+    tokens, _, _, _, reset_at = bot.rate_limiter.buckets['mentions_timeline']
+    assert int(tokens) == 74
+    assert reset_at is None
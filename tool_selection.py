@@ -0,0 +1,133 @@
+import re
+import functools
+
+import swarm.core
+from swarm import Agent
+from swarm.util import function_to_json
+
+# Tools that only read state, safe to offer for any lookup-style question
+READ_TOOLS = {
+    "get_eth_balance",
+    "get_token_balance",
+    "search_tokens",
+    "get_token_data",
+    "get_crypto_context",
+    "get_token_prices",
+    "get_portfolio_value",
+    "get_pending_transactions",
+}
+
+LOOKUP_TOOLS = {"search_tokens", "get_token_data", "get_crypto_context"}
+
+# How many of the latest user messages are matched, so a follow-up like "use chain 1"
+# keeps the tools of the request it answers
+RECENT_USER_MESSAGES = 3
+
+# (pattern over the user message, tools it needs)
+RULES = [
+    (r"\b(swap|trade|exchange|buy|sell|convert)\b",
+     {"swap_tokens", "simulate_swap", "wrap_eth", "get_token_balance", "get_token_prices"} | LOOKUP_TOOLS),
+    (r"\b(send|transfer|pay)\b",
+     {"send_eth", "get_eth_balance"}),
+    (r"\b(wrap|weth)\b",
+     {"wrap_eth", "get_eth_balance", "get_token_balance"} | LOOKUP_TOOLS),
+    (r"\b(liquidity|lp|position|mint|pool)\b",
+     {"add_v3_liquidity", "remove_v3_liquidity", "get_token_balance"} | LOOKUP_TOOLS),
+    (r"\b(aave|lend|lending|supply|deposit|withdraw|interest|yield)\b",
+     {"supply_asset", "withdraw_asset", "wrap_eth", "get_token_balance"} | LOOKUP_TOOLS),
+    (r"\b(balance|balances|how much|holdings?|own|have)\b",
+     {"get_eth_balance", "get_token_balance", "get_portfolio_value"} | LOOKUP_TOOLS),
+    (r"\b(price|prices|worth|value|usd|portfolio|twap)\b",
+     {"get_token_prices", "get_portfolio_value"} | LOOKUP_TOOLS),
+    (r"\b(pending|stuck|confirmed|transactions?|txs?)\b",
+     {"get_pending_transactions"}),
+    (r"\b(address|token|tokens|contract|router|factory|chain|slippage|gas)\b",
+     LOOKUP_TOOLS),
+]
+COMPILED_RULES = [(re.compile(pattern, re.IGNORECASE), tools) for pattern, tools in RULES]
+
+
+@functools.lru_cache(maxsize=None)
+def cached_function_to_json(func) -> dict:
+    """
+    Swarm's function_to_json, computed once per function instead of on every completion.
+    """
+    return function_to_json(func)
+
+
+def install_schema_cache():
+    """
+    Make Swarm reuse cached tool schemas. Swarm looks up function_to_json in
+    swarm.core's namespace on every call, so replacing it there is enough.
+    """
+    swarm.core.function_to_json = cached_function_to_json
+
+
+def select_tool_names(messages: list) -> set | None:
+    """
+    Pick the tools a conversation could need next with cheap keyword rules.
+
+    The latest few user messages are matched, and tools already called since the oldest
+    of them stay offered. If only lookup tools matched, nothing says what the user is
+    after, so every tool is offered.
+
+    Args:
+        messages (list): The conversation so far, ending with the latest user message.
+
+    Returns:
+        set: Tool names to offer, or None if every tool should be offered.
+    """
+    start = len(messages)
+    users = 0
+    while start > 0 and users < RECENT_USER_MESSAGES:
+        start -= 1
+        users += messages[start].get("role") == "user"
+
+    selected = set()
+    for message in messages[start:]:
+        content = message.get("content")
+        if message.get("role") == "user" and isinstance(content, str):
+            for pattern, tools in COMPILED_RULES:
+                if pattern.search(content):
+                    selected |= tools
+        for tool_call in message.get("tool_calls") or []:
+            selected.add(tool_call["function"]["name"])
+
+    if selected <= LOOKUP_TOOLS:
+        return None
+    return selected
+
+
+def is_read_only(message: str) -> bool:
+    """
+    Whether a message can only need read-only tools, so it can be prioritized.
+    """
+    names = select_tool_names([{"role": "user", "content": message}])
+    return names is not None and names <= READ_TOOLS
+
+
+def select_agent(agent: Agent, messages: list) -> Agent:
+    """
+    Return a copy of `agent` that only offers the tools the conversation could need next.
+
+    Fewer tool schemas in each request means fewer prompt tokens and a faster first token.
+    Conversations that match no rule keep the full tool list, so nothing becomes unreachable.
+
+    Args:
+        agent (Agent): The agent to narrow down.
+        messages (list): The conversation so far, ending with the latest user message.
+
+    Returns:
+        Agent: The narrowed agent, or `agent` itself if every tool may be needed.
+    """
+    names = select_tool_names(messages)
+    if names is None:
+        return agent
+
+    functions = [func for func in agent.functions if func.__name__ in names]
+    if len(functions) == len(agent.functions):
+        return agent
+    return agent.model_copy(update={"functions": functions})
+
+
+install_schema_cache()
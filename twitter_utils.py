@@ -1,14 +1,98 @@
+import os
+import json
+import time
+import queue
+import threading
 import tweepy
 from time import sleep
 from typing import List, Dict, Optional
 
+# Default v1.1 limits (requests per window in seconds), used until the API's
+# x-rate-limit-* headers tell us the real numbers
+RATE_LIMITS = {
+    'mentions_timeline': (75, 15 * 60),
+    'search_tweets': (180, 15 * 60),
+    'lookup_users': (900, 15 * 60),
+    'update_status': (300, 3 * 60 * 60),
+}
+
+STATE_PATH = 'twitter_state.json'
+
+# Replied-to tweet IDs kept for deduplication; older mentions are behind since_id anyway
+MAX_REPLIED = 10000
+
+
+class RateLimiter:
+    """Token bucket per endpoint, kept in sync with the API's rate-limit headers"""
+
+    def __init__(self, limits: Dict[str, tuple] = RATE_LIMITS):
+        self.lock = threading.Lock()
+        # endpoint -> [tokens, capacity, refill per second, last refill time, reset time].
+        # Once the API has reported a reset time, the bucket refills all at once at that time
+        self.buckets = {endpoint: [float(limit), float(limit), limit / window, time.monotonic(), None]
+                        for endpoint, (limit, window) in limits.items()}
+
+    def acquire(self, endpoint: str):
+        """Block until a request to `endpoint` is allowed"""
+        while True:
+            with self.lock:
+                bucket = self.buckets.get(endpoint)
+                if bucket is None:
+                    return
+                now = time.monotonic()
+                if bucket[4] is None:
+                    bucket[0] = min(bucket[1], bucket[0] + (now - bucket[3]) * bucket[2])
+                elif now >= bucket[4]:
+                    bucket[0] = bucket[1]
+                    bucket[4] = None
+                bucket[3] = now
+                if bucket[0] >= 1:
+                    bucket[0] -= 1
+                    return
+                wait = (1 - bucket[0]) / bucket[2] if bucket[4] is None else bucket[4] - now
+            sleep(wait)
+
+    def update(self, endpoint: str, headers):
+        """Adopt the remaining count and reset time reported by the API"""
+        if not headers or 'x-rate-limit-remaining' not in headers:
+            return
+        remaining = int(headers['x-rate-limit-remaining'])
+        limit = int(headers.get('x-rate-limit-limit', remaining))
+        reset_in = max(int(headers.get('x-rate-limit-reset', 0)) - time.time(), 1)
+        with self.lock:
+            # The API hands out nothing more until the reset, then the full limit again.
+            # Keep the configured refill rate for after that, if there is one
+            bucket = self.buckets.get(endpoint)
+            refill = bucket[2] if bucket else max(limit, 1) / reset_in
+            now = time.monotonic()
+            self.buckets[endpoint] = [float(remaining), float(max(limit, 1)), refill, now,
+                                      now + reset_in]
+
+
 class TwitterBot:
-    def __init__(self, api_key: str, api_secret: str, access_token: str, access_token_secret: str):
-        """Initialize Twitter bot with credentials"""
-        auth = tweepy.OAuthHandler(api_key, api_secret)
-        auth.set_access_token(access_token, access_token_secret)
-        self.api = tweepy.API(auth)
-        
+    def __init__(self, api_key: str, api_secret: str, access_token: str, access_token_secret: str,
+                 api=None, rate_limiter: Optional[RateLimiter] = None):
+        """
+        Initialize Twitter bot with credentials
+
+        Pass `api` to use an already configured (or local fake) tweepy.API-like object instead.
+        """
+        if api is None:
+            auth = tweepy.OAuthHandler(api_key, api_secret)
+            auth.set_access_token(access_token, access_token_secret)
+            api = tweepy.API(auth)
+        self.api = api
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.users: Dict[int, str] = {}
+
+    def call(self, endpoint: str, *args, **kwargs):
+        """Call an API method, waiting for rate-limit budget first"""
+        self.rate_limiter.acquire(endpoint)
+        result = getattr(self.api, endpoint)(*args, **kwargs)
+        last_response = getattr(self.api, 'last_response', None)
+        self.rate_limiter.update(endpoint, getattr(last_response, 'headers', None))
+        return result
+
     def post_tweet(self, content: str) -> str:
         """
         Post a tweet
@@ -20,30 +104,52 @@ class TwitterBot:
             str: Status message about the tweet
         """
         try:
-            tweet = self.api.update_status(content)
+            tweet = self.call('update_status', content)
             return f"Successfully posted tweet with ID: {tweet.id}"
-        except tweepy.TweepException as e:
+        except tweepy.TweepyException as e:
             return f"Error posting tweet: {str(e)}"
 
-    def read_mentions(self, count: int = 10) -> List[Dict]:
+    def screen_names(self, user_ids: List[int]) -> Dict[int, str]:
+        """
+        Resolve user IDs to screen names, looking up unknown users 100 at a time
+
+        Args:
+            user_ids (List[int]): IDs of the users to resolve
+
+        Returns:
+            Dict[int, str]: Screen name for each user ID
+        """
+        missing = list({user_id for user_id in user_ids if user_id not in self.users})
+        for start in range(0, len(missing), 100):
+            for user in self.call('lookup_users', user_id=missing[start:start + 100]):
+                self.users[user.id] = user.screen_name
+        return {user_id: self.users.get(user_id) for user_id in user_ids}
+
+    def read_mentions(self, count: int = 10, since_id: Optional[int] = None,
+                      max_id: Optional[int] = None) -> List[Dict]:
         """
         Read recent mentions
         
         Args:
             count (int): Number of recent mentions to retrieve
+            since_id (int): Only return mentions newer than this tweet ID
+            max_id (int): Only return mentions at or older than this tweet ID
             
         Returns:
             List[Dict]: List of mention objects containing relevant information
         """
         try:
-            mentions = self.api.mentions_timeline(count=count)
+            # trim_user keeps the payload small; authors are resolved in one batched lookup
+            mentions = self.call('mentions_timeline', count=count, since_id=since_id,
+                                 max_id=max_id, trim_user=True)
+            names = self.screen_names([mention.user.id for mention in mentions])
             return [{
                 'id': mention.id,
                 'text': mention.text,
-                'user': mention.user.screen_name,
+                'user': names[mention.user.id],
                 'created_at': mention.created_at
             } for mention in mentions]
-        except tweepy.TweepException as e:
+        except tweepy.TweepyException as e:
             return [{'error': str(e)}]
 
     def reply_to_tweet(self, tweet_id: str, content: str) -> str:
@@ -58,17 +164,15 @@ class TwitterBot:
             str: Status message about the reply
         """
         try:
-            tweet = self.api.get_status(tweet_id)
-            username = tweet.user.screen_name
-            reply_content = f"@{username} {content}"
-            
-            reply = self.api.update_status(
-                status=reply_content,
+            # auto_populate_reply_metadata adds the @mention, so there is no need to fetch the tweet
+            self.call(
+                'update_status',
+                status=content,
                 in_reply_to_status_id=tweet_id,
                 auto_populate_reply_metadata=True
             )
             return f"Successfully replied to tweet {tweet_id}"
-        except tweepy.TweepException as e:
+        except tweepy.TweepyException as e:
             return f"Error replying to tweet: {str(e)}"
 
     def search_tweets(self, query: str, count: int = 10) -> List[Dict]:
@@ -83,12 +187,124 @@ class TwitterBot:
             List[Dict]: List of matching tweets
         """
         try:
-            tweets = tweepy.Cursor(self.api.search, q=query).items(count)
+            tweets = []
+            max_id = None
+            # Page with max_id, asking for as much as the API allows per request
+            while len(tweets) < count:
+                page = self.call('search_tweets', q=query, count=min(count - len(tweets), 100),
+                                 max_id=max_id)
+                if not page:
+                    break
+                tweets.extend(page)
+                max_id = page[-1].id - 1
             return [{
                 'id': tweet.id,
                 'text': tweet.text,
                 'user': tweet.user.screen_name,
                 'created_at': tweet.created_at
-            } for tweet in tweets]
-        except tweepy.TweepException as e:
-            return [{'error': str(e)}]
\ No newline at end of file
+            } for tweet in tweets[:count]]
+        except tweepy.TweepyException as e:
+            return [{'error': str(e)}]
+
+
+class MentionIngestor:
+    """
+    Incremental mention ingestion with persistent checkpoints and a background reply worker.
+
+    Only mentions newer than the saved `since_id` are fetched, mentions already delivered
+    or replied to are never returned twice (also across restarts), and replies are queued
+    and sent by a worker thread within the rate limit.
+    """
+
+    def __init__(self, bot: TwitterBot, state_path: str = STATE_PATH, page_size: int = 200,
+                 max_replied: int = MAX_REPLIED):
+        self.bot = bot
+        self.state_path = state_path
+        self.page_size = page_size
+        self.max_replied = max_replied
+        self.lock = threading.Lock()
+        self.replies: queue.Queue = queue.Queue()
+        self.worker: Optional[threading.Thread] = None
+
+        self.since_id = None
+        self.replied = set()
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                state = json.load(f)
+            self.since_id = state.get('since_id')
+            self.replied = set(state.get('replied', []))
+
+    def save(self):
+        with self.lock:
+            # Tweet IDs grow over time, so the newest replies are the ones worth remembering
+            self.replied = set(sorted(self.replied)[-self.max_replied:])
+            state = {'since_id': self.since_id, 'replied': sorted(self.replied)}
+        # Write then rename, so a crash never leaves a truncated checkpoint
+        with open(f"{self.state_path}.tmp", 'w') as f:
+            json.dump(state, f)
+        os.replace(f"{self.state_path}.tmp", self.state_path)
+
+    def poll(self) -> List[Dict]:
+        """
+        Fetch mentions that arrived since the last poll, oldest first
+
+        A full page means there may be more, so it pages back with max_id until it
+        reaches since_id. On the very first poll only the latest page is read.
+
+        Returns:
+            List[Dict]: New mentions, in the same format as TwitterBot.read_mentions
+        """
+        mentions = []
+        max_id = None
+        while True:
+            page = self.bot.read_mentions(count=self.page_size, since_id=self.since_id, max_id=max_id)
+            if page and 'error' in page[0]:
+                # Keep since_id where it was, so the next poll retries the whole gap
+                print(f"Error reading mentions: {page[0]['error']}")
+                return []
+            mentions.extend(page)
+            if len(page) < self.page_size or self.since_id is None:
+                break
+            max_id = min(mention['id'] for mention in page) - 1
+
+        new = [mention for mention in mentions if mention['id'] not in self.replied]
+        if mentions:
+            with self.lock:
+                self.since_id = max([mention['id'] for mention in mentions] + [self.since_id or 0])
+            self.save()
+        return sorted(new, key=lambda mention: mention['id'])
+
+    def queue_reply(self, tweet_id: int, content: str) -> str:
+        """
+        Reply to a tweet, such as a mention. The reply is sent in the background, and only
+        once per tweet
+
+        Args:
+            tweet_id (int): ID of the tweet to reply to
+            content (str): Content of the reply
+
+        Returns:
+            str: Status message about the queued reply
+        """
+        with self.lock:
+            if tweet_id in self.replied:
+                return f"Already replied to tweet {tweet_id}"
+            self.replied.add(tweet_id)
+
+        self.replies.put((tweet_id, content))
+        if self.worker is None or not self.worker.is_alive():
+            self.worker = threading.Thread(target=self.send_replies, daemon=True)
+            self.worker.start()
+        return f"Queued reply to tweet {tweet_id}"
+
+    def send_replies(self):
+        while True:
+            tweet_id, content = self.replies.get()
+            result = self.bot.reply_to_tweet(tweet_id, content)
+            if result.startswith("Error"):
+                print(result)
+                # Allow a later retry of this tweet
+                with self.lock:
+                    self.replied.discard(tweet_id)
+            self.save()
+            self.replies.task_done()